@@ -0,0 +1,232 @@
+"""
+Static and media file serving for gunicorn deployments.
+
+Unlike django.views.static.serve this answers conditional requests with
+304, honours single byte ranges, picks the .br/.gz copies written by
+CompressedStaticFilesStorage when the client accepts them, and hands whole
+files to the WSGI server's file wrapper (sendfile) instead of buffering.
+"""
+import gzip
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Tried in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.html', '.txt', '.xml', '.ico', '.ttf', '.otf', '.eot',
+}
+
+# Types for files that are themselves compressed (x.css.gz requested by
+# name), which are sent as they are, without Content-Encoding
+ENCODED_TYPES = {'gzip': 'application/gzip', 'bzip2': 'application/x-bzip2', 'xz': 'application/x-xz'}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class CompressedStaticFilesStorage(StaticFilesStorage):
+    """
+    Writes gzip (and brotli, when the optional `brotli` package is
+    installed) copies of compressible files next to the originals during
+    collectstatic, so they are never compressed per request.
+    """
+    min_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name in paths:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            with self.open(name) as original:
+                data = original.read()
+            if len(data) < self.min_size:
+                continue
+            compressed = False
+            for extension, compress in self.compressors():
+                encoded = compress(data)
+                # Not worth serving when it barely shrinks
+                if len(encoded) >= len(data) * 0.95:
+                    continue
+                with open(self.path(name) + extension, 'wb') as target:
+                    target.write(encoded)
+                compressed = True
+            if compressed:
+                yield name, name, True
+
+    def compressors(self):
+        yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+def accepted_encodings(request):
+    accept = request.headers.get('Accept-Encoding', '')
+    return {part.split(';')[0].strip().lower() for part in accept.split(',') if part.strip()}
+
+
+def etag_matches(if_none_match, etag):
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    # Weak comparison, as required for If-None-Match
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def parse_range(header, size):
+    """
+    Parses a single `bytes=` range.
+
+    Returns:
+        tuple: (start, end) inclusive, None to ignore the header, or False
+        when the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+@require_safe
+def serve(request, path, document_root=None, immutable=None):
+    """
+    Serves `path` from `document_root`.
+
+    Args:
+        immutable: Optional callable taking the path; files it accepts are
+            sent with a one year `immutable` Cache-Control (e.g. content
+            addressed names). Everything else gets STATIC_MAX_AGE.
+    """
+    try:
+        fullpath = safe_join(document_root, path)
+        stat_result = os.stat(fullpath)
+    except (SuspiciousFileOperation, ValueError, OSError):
+        raise Http404("File not found")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404("File not found")
+
+    content_type, file_encoding = mimetypes.guess_type(fullpath)
+    if file_encoding:
+        content_type = ENCODED_TYPES.get(file_encoding, 'application/octet-stream')
+    content_type = content_type or 'application/octet-stream'
+
+    # Prefer a precompressed copy, unless a byte range was asked for
+    encoding = None
+    range_header = request.headers.get('Range')
+    if not range_header and not file_encoding:
+        accepted = accepted_encodings(request)
+        for name, extension in ENCODINGS:
+            if name not in accepted:
+                continue
+            try:
+                encoded_stat = os.stat(fullpath + extension)
+            except OSError:
+                continue
+            if encoded_stat.st_mtime >= stat_result.st_mtime:
+                encoding, fullpath, stat_result = name, fullpath + extension, encoded_stat
+                break
+
+    etag = '"%x-%x%s"' % (stat_result.st_mtime_ns, stat_result.st_size, f'-{encoding}' if encoding else '')
+    last_modified = int(stat_result.st_mtime)
+    if immutable is not None and immutable(path):
+        cache_control = 'public, max-age=31536000, immutable'
+    else:
+        cache_control = f"public, max-age={getattr(settings, 'STATIC_MAX_AGE', 3600)}"
+
+    def add_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return add_headers(HttpResponseNotModified())
+    else:
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if if_modified_since is not None and last_modified <= if_modified_since:
+            return add_headers(HttpResponseNotModified())
+
+    size = stat_result.st_size
+    byte_range = None
+    if range_header:
+        # A stale If-Range means the client wants the whole new file
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return add_headers(response)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(open(fullpath, 'rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        # FileResponse goes through wsgi.file_wrapper, i.e. sendfile under gunicorn
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(size)
+        # Would otherwise name the .gz/.br file
+        del response['Content-Disposition']
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return add_headers(response)
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     "rest_framework_simplejwt",
     "drf_yasg",
     "rest_framework",
+    "django_filters",
     "corsheaders",
     "users",
     "products"
@@ -67,7 +68,8 @@ REST_FRAMEWORK = {
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
 
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Builds request.user from token claims, without a User query
+        'users.authentication.StatelessJWTAuthentication',
      
       
     )
@@ -106,6 +108,27 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Switch to django.core.cache.backends.filebased.FileBasedCache (or another
+# shared backend) so catalog invalidations reach every worker process.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "gorgeis-default"),
+    }
+}
+
+# Seconds a cached product list/detail response stays valid
+PRODUCT_CACHE_TIMEOUT = int(os.getenv("PRODUCT_CACHE_TIMEOUT", 300))
+# Most relevant matches returned for a product search (?q=)
+PRODUCT_SEARCH_MAX_RESULTS = int(os.getenv("PRODUCT_SEARCH_MAX_RESULTS", 500))
+# Seconds between checks of the autocomplete version by the per-process
+# autocomplete index, which rebuilds itself when another process changed it
+AUTOCOMPLETE_REFRESH_INTERVAL = int(os.getenv("AUTOCOMPLETE_REFRESH_INTERVAL", 30))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -141,6 +164,11 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = "static/"
+# collectstatic target, served by dorgeisbackend.serving together with the
+# .gz/.br copies it writes
+STATIC_ROOT = BASE_DIR / "staticfiles"
+# Cache lifetime for static/media files whose names are not content hashes
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", 3600))
 
 MEDIA_URL = '/images/'
 STATICFILES_DIRS =[
@@ -148,6 +176,45 @@ STATICFILES_DIRS =[
 ]
 MEDIA_ROOT  ='static/images'
 
+# https://docs.djangoproject.com/en/5.1/ref/settings/#storages
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "dorgeisbackend.serving.CompressedStaticFilesStorage",
+    },
+    # Product images are stored once per distinct content, named by hash
+    "product_images": {
+        "BACKEND": "products.storage.ContentAddressedStorage",
+    },
+}
+
+# Resized product image variants are built on a background thread pool
+PRODUCT_IMAGE_WORKERS = int(os.getenv("PRODUCT_IMAGE_WORKERS", 2))
+# False builds the variants inline on save (tests, management commands)
+PRODUCT_IMAGE_VARIANTS_ASYNC = os.getenv("PRODUCT_IMAGE_VARIANTS_ASYNC", "True") == "True"
+# Carts not used for this long are deleted by `manage.py purge_carts`
+CART_TTL = timedelta(days=int(os.getenv("CART_TTL_DAYS", 30)))
+# Where carts live until checkout: products.carts.OrmCartStorage (database
+# rows) or products.carts.CacheCartStorage (one blob per cart in the cache)
+CART_STORAGE = os.getenv("CART_STORAGE", "products.carts.OrmCartStorage")
+# Cache used by CacheCartStorage; needs a shared backend (Redis, memcached)
+# once more than one process serves the API
+CART_CACHE_ALIAS = os.getenv("CART_CACHE_ALIAS", "default")
+# Stock added to a cart stays reserved this long after the cart's last
+# change; `manage.py release_reservations` hands back expired holds
+STOCK_RESERVATION_TTL = timedelta(minutes=int(os.getenv("STOCK_RESERVATION_TTL_MINUTES", 15)))
+
+# Pending orders are run through this handler by `manage.py process_orders`;
+# a subclass of products.orders.BaseOrderHandler
+ORDER_PROCESSING_HANDLER = os.getenv("ORDER_PROCESSING_HANDLER", "products.orders.StubOrderHandler")
+ORDER_PROCESSING_BATCH_SIZE = int(os.getenv("ORDER_PROCESSING_BATCH_SIZE", 50))
+ORDER_PROCESSING_WORKERS = int(os.getenv("ORDER_PROCESSING_WORKERS", 4))
+ORDER_PROCESSING_MAX_ATTEMPTS = int(os.getenv("ORDER_PROCESSING_MAX_ATTEMPTS", 5))
+# Seconds before the first retry, doubled on every further attempt
+ORDER_PROCESSING_RETRY_DELAY = int(os.getenv("ORDER_PROCESSING_RETRY_DELAY", 30))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -159,9 +226,19 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "AUTH_HEADER_TYPES": ("Bearer",),
+    # Every refresh hands out a new refresh token and revokes the old one
+    # (users.tokens.RevocableRefreshToken, no token_blacklist app needed)
+    "ROTATE_REFRESH_TOKENS": True,
     'BLACKLIST_AFTER_ROTATION': True
     
 }
+# Seconds a user's profile fields stay cached for views that need more
+# than the token claims (users.authentication.get_cached_user)
+USER_CACHE_TIMEOUT = int(os.getenv("USER_CACHE_TIMEOUT", 60))
+# Revoked token jtis are kept in a per-process Bloom filter, refreshed from
+# the database at most every TOKEN_REVOCATION_SYNC_INTERVAL seconds
+TOKEN_REVOCATION_SYNC_INTERVAL = int(os.getenv("TOKEN_REVOCATION_SYNC_INTERVAL", 5))
+TOKEN_REVOCATION_CAPACITY = int(os.getenv("TOKEN_REVOCATION_CAPACITY", 100_000))
 
 # settings.py
 EMAIL_BACKEND = os.getenv("EMAIL_BACKEND")
@@ -171,10 +248,24 @@ EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS")
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL")
+# Outbox (users.outbox): flush on a background thread after each queued
+# email, or leave it to `manage.py send_queued_email` when disabled
+EMAIL_OUTBOX_SEND_IN_PROCESS = os.getenv("EMAIL_OUTBOX_SEND_IN_PROCESS", "True") == "True"
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+# Seconds before the first retry, doubled on every further attempt
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv("EMAIL_OUTBOX_RETRY_DELAY", 60))
+# Sent and failed messages older than this are deleted by
+# `manage.py prune_email_outbox`
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", 7))
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
 
+# Keys the permutation that turns sequence numbers into slugs (falls back
+# to SECRET_KEY). Changing it could make new slugs collide with old ones.
 PRODUCT_SLUG_SECRET_KEY = os.getenv("PRODUCT_SLUG_SECRET_KEY")
+# Sequence numbers reserved per database round trip by each process
+PRODUCT_SLUG_BLOCK_SIZE = int(os.getenv("PRODUCT_SLUG_BLOCK_SIZE", 100))
 # # AWS S3 settings
 # AWS_ACCESS_KEY_ID = 'your-access-key'
 # AWS_SECRET_ACCESS_KEY = 'your-secret-key'
@@ -0,0 +1,78 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase
+
+from .serving import serve
+
+CSS = b'body { color: #333; }\n' * 40
+
+
+class ServeTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.base = tempfile.mkdtemp()
+        cls.root = os.path.join(cls.base, 'static')
+        os.mkdir(cls.root)
+        with open(os.path.join(cls.base, 'secret.txt'), 'wb') as f:
+            f.write(b'secret')
+        with open(os.path.join(cls.root, 'site.css'), 'wb') as f:
+            f.write(CSS)
+        with open(os.path.join(cls.root, 'site.css.gz'), 'wb') as f:
+            f.write(gzip.compress(CSS, mtime=0))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.base)
+        super().tearDownClass()
+
+    def get(self, path, **headers):
+        response = serve(RequestFactory().get('/', headers=headers), path, document_root=self.root)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_etag_answers_with_not_modified(self):
+        etag = self.get('site.css')['ETag']
+        response = self.get('site.css', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.get('site.css', if_none_match='"other"').status_code, 200)
+
+    def test_byte_ranges(self):
+        response = self.get('site.css', range='bytes=5-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 5-9/{len(CSS)}')
+        self.assertEqual(self.body(response), CSS[5:10])
+
+        self.assertEqual(self.body(self.get('site.css', range='bytes=-4')), CSS[-4:])
+        response = self.get('site.css', range=f'bytes={len(CSS)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(CSS)}')
+
+    def test_precompressed_copy_when_accepted(self):
+        response = self.get('site.css', accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(self.body(response)), CSS)
+
+        response = self.get('site.css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self.body(response), CSS)
+
+    def test_compressed_file_by_name(self):
+        response = self.get('site.css.gz', accept_encoding='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(gzip.decompress(self.body(response)), CSS)
+
+    def test_paths_outside_the_root_are_not_found(self):
+        with self.assertRaises(Http404):
+            self.get('../secret.txt')
+        with self.assertRaises(Http404):
+            self.get(os.path.join(self.base, 'secret.txt'))
@@ -15,10 +15,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from dorgeisbackend.serving import serve
+from products.storage import is_content_addressed
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -49,4 +52,17 @@ urlpatterns = [
     path('api/swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Media and collected static files, with ETag/304, byte ranges and
+# precompressed variants (see dorgeisbackend/serving.py)
+urlpatterns += [
+    re_path(
+        r"^%s(?P<path>.*)$" % re.escape(settings.MEDIA_URL.lstrip("/")),
+        serve,
+        {"document_root": settings.MEDIA_ROOT, "immutable": is_content_addressed},
+    ),
+    re_path(
+        r"^%s(?P<path>.*)$" % re.escape(settings.STATIC_URL.lstrip("/")),
+        serve,
+        {"document_root": settings.STATIC_ROOT},
+    ),
+]
\ No newline at end of file
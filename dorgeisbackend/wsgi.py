@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dorgeisbackend.settings")
 
 application = get_wsgi_application()
+
+# Build the autocomplete index before the first request reaches this worker
+from products.autocomplete import autocomplete_index  # noqa: E402
+
+autocomplete_index.warm()
@@ -1,10 +1,13 @@
 from django.contrib import admin
 
-from products.models import Cart, CartItems, Order, OrderItem, Product
+from products.models import Cart, CartItems, DiscountSchedule, Order, OrderItem, OrderTransition, Product, StockReservation
 
 # Register your models here.
 admin.site.register(Product)
+admin.site.register(DiscountSchedule)
 admin.site.register(Cart)
 admin.site.register(CartItems)
 admin.site.register(Order)
-admin.site.register(OrderItem)
\ No newline at end of file
+admin.site.register(OrderItem)
+admin.site.register(StockReservation)
+admin.site.register(OrderTransition)
\ No newline at end of file
@@ -0,0 +1,216 @@
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import bump_version, get_version
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Matches in the product name rank above matches in the pack title
+FIELDS = ('productname', 'packtitle')
+
+# Prefixes this short span a large share of the index; their ranking is
+# kept until the index changes instead of being recomputed on every lookup
+MEMO_PREFIX_LENGTH = 2
+
+# Moved only by changes to indexed fields, unlike the catalog version,
+# which every stock or price change moves
+AUTOCOMPLETE_VERSION_KEY = "products:autocomplete:version"
+
+
+def get_autocomplete_version():
+    return get_version(AUTOCOMPLETE_VERSION_KEY)
+
+
+def bump_autocomplete_version():
+    return bump_version(AUTOCOMPLETE_VERSION_KEY)
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall((text or '').casefold()))
+
+
+def index_keys(product):
+    """
+    Keys under which a product can be found: every word of its name and
+    pack title together with the rest of the text, so "wash" and "face w"
+    both reach "Rose Face Wash".
+
+    Yields:
+        tuple: (key, field rank, word position)
+    """
+    for rank, field in enumerate(FIELDS):
+        words = normalize(product[field]).split(' ')
+        for position in range(len(words)):
+            if words[position]:
+                yield ' '.join(words[position:]), rank, position
+
+
+class AutocompleteIndex:
+    """
+    Per-process prefix index over product names and pack titles.
+
+    Entries are kept in one sorted list of (key, product id, field rank,
+    word position) tuples; a lookup is a binary search followed by a scan
+    over the keys sharing the prefix, with no database access. Rankings of
+    one- and two-letter prefixes, whose ranges are the longest, are
+    remembered until the next change.
+
+    The index follows Product saves and deletes in this process through
+    signals. Every change to an indexed field moves the autocomplete
+    version; changes made elsewhere (other workers, bulk imports) leave the
+    index behind that version, which it notices within
+    AUTOCOMPLETE_REFRESH_INTERVAL seconds and rebuilds itself on a
+    background thread while lookups keep using the current entries.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.refresh_lock = threading.Lock()
+        self.entries = []
+        self.products = {}
+        self.ranked = {}
+        self.version = None
+        self.checked_at = None
+
+    def build(self):
+        """Loads every product with one query and swaps in the new index."""
+        from .models import Product
+
+        version = get_autocomplete_version()
+        products = {
+            row['id']: row
+            for row in Product.objects.values('id', 'slug', *FIELDS).iterator()
+        }
+        entries = sorted(
+            (key, pk, rank, position)
+            for pk, product in products.items()
+            for key, rank, position in index_keys(product)
+        )
+        with self.lock:
+            self.entries, self.products = entries, products
+            self.ranked = {}
+            self.version = version
+            self.checked_at = time.monotonic()
+        return len(products)
+
+    def ensure_fresh(self):
+        if self.checked_at is None:
+            # First use only; wsgi.py normally builds the index at startup
+            with self.refresh_lock:
+                if self.checked_at is None:
+                    self.build()
+            return
+
+        interval = getattr(settings, 'AUTOCOMPLETE_REFRESH_INTERVAL', 30)
+        if time.monotonic() - self.checked_at < interval:
+            return
+        self.checked_at = time.monotonic()
+        if get_autocomplete_version() != self.version and self.refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh, name='autocomplete-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Could not rebuild the autocomplete index")
+        finally:
+            self.refresh_lock.release()
+            connection.close()
+
+    def _advance(self, version):
+        # A change that moved the version by exactly one step from ours is
+        # the only one since; anything else is left to the next rebuild
+        if version is not None and self.version is not None and version == self.version + 1:
+            self.version = version
+
+    def update(self, product, version=None):
+        """
+        Adds or replaces one product.
+
+        Args:
+            product (dict): id, slug, productname and packtitle
+            version (int): Autocomplete version the change moved to
+        """
+        with self.lock:
+            if self.checked_at is None:
+                # Not built yet; the first lookup will load everything
+                return
+            self._remove(product['id'])
+            self.ranked = {}
+            self.products[product['id']] = product
+            for key, rank, position in index_keys(product):
+                insort(self.entries, (key, product['id'], rank, position))
+            self._advance(version)
+
+    def remove(self, product_id, version=None):
+        with self.lock:
+            self._remove(product_id)
+            self._advance(version)
+
+    def _remove(self, product_id):
+        product = self.products.pop(product_id, None)
+        if product is None:
+            return
+        self.ranked = {}
+        for key, rank, position in index_keys(product):
+            entry = (key, product_id, rank, position)
+            i = bisect_left(self.entries, entry)
+            if i < len(self.entries) and self.entries[i] == entry:
+                del self.entries[i]
+
+    def search(self, query, limit=10):
+        """
+        Returns up to `limit` products whose name or pack title contains a
+        word starting with `query` (multi-word queries match consecutive
+        words). Name matches come first, then earlier words, then shorter
+        names.
+
+        Returns:
+            list: dicts with id, slug, productname and packtitle
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self.ensure_fresh()
+
+        with self.lock:
+            ranked = self.ranked.get(prefix)
+            if ranked is None:
+                ranked = self._rank(prefix)
+                if len(prefix) <= MEMO_PREFIX_LENGTH:
+                    self.ranked[prefix] = ranked
+            return [self.products[pk] for pk in ranked[:limit]]
+
+    def _rank(self, prefix):
+        # Every key with the prefix is looked at, so a good match is never
+        # cut off by the alphabetical order of the keys
+        entries, products = self.entries, self.products
+        best = {}
+        i = bisect_left(entries, (prefix,))
+        while i < len(entries) and entries[i][0].startswith(prefix):
+            key, pk, rank, position = entries[i]
+            score = (rank, position, len(products[pk]['productname']), pk)
+            if pk not in best or score < best[pk]:
+                best[pk] = score
+            i += 1
+        return sorted(best, key=best.get)
+
+    def warm(self):
+        """Builds the index ahead of the first request; logged, never raised."""
+        try:
+            count = self.build()
+        except Exception:
+            logger.exception("Could not build the autocomplete index; it will be built on first use")
+        else:
+            logger.info("Autocomplete index built for %s products", count)
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,94 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "products:catalog:version"
+
+
+def get_catalog_cache():
+    """
+    Returns the cache used for catalog responses.
+
+    Any Django cache backend works; use a shared backend (file, redis,
+    memcached) when several worker processes must see the same invalidation.
+    """
+    return caches[getattr(settings, "PRODUCT_CACHE_ALIAS", "default")]
+
+
+def get_version(key):
+    """
+    Returns the version counter stored under `key`, initialising it if
+    needed.
+
+    The initial value is time based so that an evicted version key never
+    brings back entries written under an older version.
+    """
+    cache = get_catalog_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """Moves the counter under `key` on and returns the new value."""
+    cache = get_catalog_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """
+    Invalidates every cached catalog response by moving to a new version.
+    Old entries are never read again and simply expire.
+    """
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def catalog_cache_key(request):
+    """
+    Builds the cache key for a catalog request from the catalog version and
+    the absolute URL (host and query string included, since both show up in
+    the serialized response).
+    """
+    url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"products:catalog:{get_catalog_version()}:{url_hash}"
+
+
+def cached_catalog_response(request, build_response, refresh=None):
+    """
+    Read-through cache for catalog GET requests.
+
+    Args:
+        request: The incoming DRF request
+        build_response: Callable producing the uncached Response
+        refresh: Optional callable updating cached data in place before it
+            is returned, for values that change too often to invalidate on
+
+    Returns:
+        Response: The cached or freshly built response
+    """
+    cache = get_catalog_cache()
+    key = catalog_cache_key(request)
+    data = cache.get(key)
+    if data is not None:
+        if refresh is not None:
+            refresh(data)
+        return Response(data)
+
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, getattr(settings, "PRODUCT_CACHE_TIMEOUT", 300))
+    return response
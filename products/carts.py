@@ -0,0 +1,392 @@
+import time
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Cart, CartItems, Product
+from .reservations import hold_stock, release_cart
+
+MAX_QUANTITY = 32767
+
+OPERATION_ADD = 'add'
+OPERATION_SET = 'set'
+OPERATION_REMOVE = 'remove'
+
+
+class QuantityTooLarge(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f"Quantity too large for Products {product_ids}")
+        self.product_ids = product_ids
+
+
+@dataclass
+class CartLine:
+    """One product in a cart. `id` is what the item endpoints are addressed by."""
+    id: int
+    cart: uuid.UUID
+    product_id: int
+    quantity: int
+    product: Product = None
+
+
+@dataclass
+class CartSummary:
+    id: uuid.UUID
+    item_count: int = 0
+    total: Decimal = Decimal('0.00')
+
+
+@dataclass
+class CartContents(CartSummary):
+    items: list = field(default_factory=list)
+
+
+def fold_operations(quantities, operations):
+    """
+    Applies add/set/remove operations, in order, to a mapping of product id
+    to quantity.
+
+    Returns:
+        dict: The new quantities; removed products are left at 0
+    """
+    quantities = dict(quantities)
+    for operation in operations:
+        product_id = operation['product_id']
+        if operation['op'] == OPERATION_ADD:
+            quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+        elif operation['op'] == OPERATION_SET:
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities[product_id] = 0
+    too_many = sorted(pk for pk, quantity in quantities.items() if quantity > MAX_QUANTITY)
+    if too_many:
+        raise QuantityTooLarge(too_many)
+    return quantities
+
+
+class BaseCartStorage:
+    """
+    Where carts live between the first add-to-cart and checkout.
+
+    Carts are addressed by UUID. Item methods take the line id the backend
+    hands out in CartLine.id. Methods return None (or False) when the cart
+    or line does not exist.
+
+    Every change also reserves the cart's new quantities (see
+    products.reservations) and raises OutOfStock, changing nothing, when
+    the stock cannot cover them.
+    """
+
+    def create(self):
+        raise NotImplementedError
+
+    def delete(self, cart_id):
+        raise NotImplementedError
+
+    def get_lines(self, cart_id):
+        """Returns the cart's lines without their products, or None."""
+        raise NotImplementedError
+
+    def add(self, cart_id, product_id, quantity):
+        """Adds to the quantity of a product and returns its CartLine."""
+        raise NotImplementedError
+
+    def set_quantity(self, cart_id, line_id, quantity):
+        raise NotImplementedError
+
+    def remove(self, cart_id, line_id):
+        raise NotImplementedError
+
+    def apply(self, cart_id, operations):
+        """
+        Applies a batch of add/set/remove operations atomically.
+
+        Returns:
+            dict: The resulting quantities, or None if the cart does not exist
+        """
+        raise NotImplementedError
+
+    def get_contents(self, cart_id):
+        """Returns the cart with every line's product loaded, or None."""
+        lines = self.get_lines(cart_id)
+        if lines is None:
+            return None
+        lines = load_products(lines)
+        return CartContents(id=cart_id, items=lines, **sum_lines(lines))
+
+    def get_summary(self, cart_id):
+        """Returns the cart's item count and total, or None."""
+        lines = self.get_lines(cart_id)
+        if lines is None:
+            return None
+        prices = dict(
+            Product.objects.filter(pk__in={line.product_id for line in lines}).values_list('id', 'discountPrice')
+        )
+        lines = [line for line in lines if line.product_id in prices]
+        return CartSummary(
+            id=cart_id,
+            item_count=sum(line.quantity for line in lines),
+            total=sum((line.quantity * (prices[line.product_id] or 0) for line in lines), Decimal('0.00')),
+        )
+
+
+def load_products(lines):
+    """
+    Loads the products of `lines` in one query. Lines whose product was
+    deleted meanwhile are left out.
+    """
+    products = Product.objects.only('id', 'productname', 'discountPrice').in_bulk(
+        {line.product_id for line in lines}
+    )
+    for line in lines:
+        line.product = products.get(line.product_id)
+    return [line for line in lines if line.product is not None]
+
+
+def sum_lines(lines):
+    return {
+        'item_count': sum(line.quantity for line in lines),
+        'total': sum((line.quantity * (line.product.discountPrice or 0) for line in lines), Decimal('0.00')),
+    }
+
+
+class OrmCartStorage(BaseCartStorage):
+    """
+    Carts as Cart and CartItems rows (the default). Every change also
+    touches the Cart row in the same transaction: updated_at drives
+    `manage.py purge_carts`, item_count and total serve cart summaries.
+    """
+
+    def create(self):
+        return Cart.objects.create().pk
+
+    def delete(self, cart_id):
+        with transaction.atomic():
+            release_cart(cart_id)
+            deleted, _ = Cart.objects.filter(pk=cart_id).delete()
+        return bool(deleted)
+
+    def get_lines(self, cart_id):
+        lines = [
+            CartLine(id=pk, cart=cart_id, product_id=product_id, quantity=quantity)
+            for pk, product_id, quantity in CartItems.objects.filter(cart_id=cart_id, product__isnull=False)
+            .order_by('id')
+            .values_list('id', 'product_id', 'quantity')
+        ]
+        if not lines and not Cart.objects.filter(pk=cart_id).exists():
+            return None
+        return lines
+
+    def get_contents(self, cart_id):
+        summary = self.get_summary(cart_id)
+        if summary is None:
+            return None
+        # Items and their products in one joined query
+        lines = [
+            CartLine(id=item.pk, cart=cart_id, product_id=item.product_id, quantity=item.quantity, product=item.product)
+            for item in CartItems.objects.filter(cart_id=cart_id, product__isnull=False)
+            .select_related('product')
+            .order_by('id')
+        ]
+        return CartContents(id=cart_id, item_count=summary.item_count, total=summary.total, items=lines)
+
+    def get_summary(self, cart_id):
+        # One row read, see CartQuerySet.touch()
+        row = Cart.objects.filter(pk=cart_id).values('item_count', 'total').first()
+        return CartSummary(id=cart_id, **row) if row is not None else None
+
+    def add(self, cart_id, product_id, quantity):
+        with transaction.atomic():
+            item = CartItems.objects.add_quantity(cart_id, product_id, quantity)
+            if item is None:
+                return None
+            hold_stock(cart_id, {product_id: item.quantity})
+            Cart.objects.touch(cart_id)
+        return CartLine(id=item.pk, cart=cart_id, product_id=product_id, quantity=item.quantity)
+
+    def set_quantity(self, cart_id, line_id, quantity):
+        with transaction.atomic():
+            product_id = (
+                CartItems.objects.filter(pk=line_id, cart_id=cart_id)
+                .values_list('product_id', flat=True)
+                .first()
+            )
+            if product_id is None:
+                return None
+            hold_stock(cart_id, {product_id: quantity})
+            CartItems.objects.filter(pk=line_id).update(quantity=quantity)
+            Cart.objects.touch(cart_id)
+        return CartLine(id=line_id, cart=cart_id, product_id=product_id, quantity=quantity)
+
+    def remove(self, cart_id, line_id):
+        with transaction.atomic():
+            product_id = (
+                CartItems.objects.filter(pk=line_id, cart_id=cart_id)
+                .values_list('product_id', flat=True)
+                .first()
+            )
+            deleted, _ = CartItems.objects.filter(pk=line_id, cart_id=cart_id).delete()
+            if deleted:
+                if product_id is not None:
+                    hold_stock(cart_id, {product_id: 0})
+                Cart.objects.touch(cart_id)
+        return bool(deleted)
+
+    def apply(self, cart_id, operations):
+        product_ids = {operation['product_id'] for operation in operations}
+        with transaction.atomic():
+            if not Cart.objects.touch(cart_id):
+                return None
+            current = dict(
+                CartItems.objects.select_for_update()
+                .filter(cart_id=cart_id, product_id__in=product_ids)
+                .values_list('product_id', 'quantity')
+            )
+            quantities = fold_operations(current, operations)
+            hold_stock(cart_id, quantities)
+
+            # One DELETE and one bulk upsert, whatever the number of operations
+            removed = [pk for pk, quantity in quantities.items() if quantity == 0 and pk in current]
+            changed = [
+                CartItems(cart_id=cart_id, product_id=pk, quantity=quantity)
+                for pk, quantity in quantities.items()
+                if quantity > 0 and current.get(pk) != quantity
+            ]
+            if removed:
+                CartItems.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+            if changed:
+                CartItems.objects.bulk_create(
+                    changed,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity'],
+                )
+            Cart.objects.filter(pk=cart_id).refresh_totals()
+        return quantities
+
+
+class CacheCartStorage(BaseCartStorage):
+    """
+    Carts as one small blob per cart in a Django cache (CART_CACHE_ALIAS),
+    e.g. Redis or memcached in production and locmem in tests.
+
+    The blob maps product id to quantity, so line ids are product ids.
+    Carts expire CART_TTL after their last change; nothing is written to
+    the database until checkout turns the cart into an Order. Totals are
+    not stored with the blob, since the cache cannot be searched for the
+    carts holding a repriced product; summaries read the current prices
+    in one query instead.
+    """
+    lock_timeout = 5
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+        self.timeout = int(settings.CART_TTL.total_seconds())
+
+    def key(self, cart_id):
+        return f'carts:{cart_id}'
+
+    def lock(self, cart_id):
+        return CacheLock(self.cache, f'carts:{cart_id}:lock', self.lock_timeout)
+
+    def read(self, cart_id):
+        return self.cache.get(self.key(cart_id))
+
+    def write(self, cart_id, quantities):
+        self.cache.set(self.key(cart_id), quantities, self.timeout)
+
+    def create(self):
+        cart_id = uuid.uuid4()
+        self.write(cart_id, {})
+        return cart_id
+
+    def delete(self, cart_id):
+        exists = self.read(cart_id) is not None
+        release_cart(cart_id)
+        # Runs after commit when called from checkout, so a failed order
+        # keeps the cart
+        transaction.on_commit(lambda: self.cache.delete(self.key(cart_id)))
+        return exists
+
+    def lines(self, cart_id, quantities):
+        return [
+            CartLine(id=product_id, cart=cart_id, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+        ]
+
+    def get_lines(self, cart_id):
+        quantities = self.read(cart_id)
+        if quantities is None:
+            return None
+        return self.lines(cart_id, quantities)
+
+    def add(self, cart_id, product_id, quantity):
+        with self.lock(cart_id):
+            quantities = self.read(cart_id)
+            if quantities is None or not Product.objects.filter(pk=product_id).exists():
+                return None
+            quantities = fold_operations(quantities, [{'op': OPERATION_ADD, 'product_id': product_id, 'quantity': quantity}])
+            hold_stock(cart_id, {product_id: quantities[product_id]})
+            self.write(cart_id, quantities)
+        return CartLine(id=product_id, cart=cart_id, product_id=product_id, quantity=quantities[product_id])
+
+    def set_quantity(self, cart_id, line_id, quantity):
+        with self.lock(cart_id):
+            quantities = self.read(cart_id)
+            if quantities is None or line_id not in quantities:
+                return None
+            hold_stock(cart_id, {line_id: quantity})
+            quantities[line_id] = quantity
+            self.write(cart_id, quantities)
+        return CartLine(id=line_id, cart=cart_id, product_id=line_id, quantity=quantity)
+
+    def remove(self, cart_id, line_id):
+        with self.lock(cart_id):
+            quantities = self.read(cart_id)
+            if quantities is None or quantities.pop(line_id, None) is None:
+                return False
+            hold_stock(cart_id, {line_id: 0})
+            self.write(cart_id, quantities)
+        return True
+
+    def apply(self, cart_id, operations):
+        with self.lock(cart_id):
+            quantities = self.read(cart_id)
+            if quantities is None:
+                return None
+            quantities = fold_operations(quantities, operations)
+            hold_stock(cart_id, quantities)
+            self.write(cart_id, {pk: quantity for pk, quantity in quantities.items() if quantity > 0})
+        return quantities
+
+
+class CacheLock:
+    """
+    Per-cart mutex on top of cache.add(), which is atomic on every backend
+    that is shared between processes. Expires after `timeout` seconds so a
+    crashed worker cannot block a cart for good.
+    """
+
+    def __init__(self, cache, key, timeout):
+        self.cache, self.key, self.timeout = cache, key, timeout
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while not self.cache.add(self.key, 1, self.timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock {self.key}")
+            time.sleep(0.005)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cache.delete(self.key)
+
+
+def get_cart_storage():
+    """Returns an instance of the CART_STORAGE backend."""
+    return import_string(getattr(settings, 'CART_STORAGE', 'products.carts.OrmCartStorage'))()
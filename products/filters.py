@@ -0,0 +1,32 @@
+from django.db.models import F
+from django_filters import rest_framework as filters
+
+from .models import Product
+
+
+class ProductFilter(filters.FilterSet):
+    """
+    Server-side catalog filters. Each one maps onto an index declared in
+    Product.Meta: on_sale and in_stock walk an index in the cursor's id
+    order, so a page stops after page_size rows; the price and discount
+    ranges are index range scans whose matches are sorted by id.
+    """
+    min_price = filters.NumberFilter(field_name='discountPrice', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='discountPrice', lookup_expr='lte')
+    min_discount = filters.NumberFilter(field_name='discountPercentage', lookup_expr='gte')
+    max_discount = filters.NumberFilter(field_name='discountPercentage', lookup_expr='lte')
+    on_sale = filters.BooleanFilter(method='filter_on_sale')
+    in_stock = filters.BooleanFilter(method='filter_in_stock')
+
+    class Meta:
+        model = Product
+        fields = []
+
+    def filter_on_sale(self, queryset, name, value):
+        # Same condition as the partial index product_on_sale_idx; covers
+        # discounts from DiscountSchedule windows as well
+        on_sale = {'discountPrice__lt': F('originalprice')}
+        return queryset.filter(**on_sale) if value else queryset.exclude(**on_sale)
+
+    def filter_in_stock(self, queryset, name, value):
+        return queryset.filter(stock__gt=0) if value else queryset.filter(stock=0)
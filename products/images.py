@@ -0,0 +1,139 @@
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+from .storage import release_blobs, retain_blobs, variant_names
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each variant; images are never upscaled
+VARIANT_SIZES = {
+    'thumbnail': 160,
+    'card': 480,
+    'detail': 1200,
+}
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the process-wide worker pool used to build image variants.
+    Size it with PRODUCT_IMAGE_WORKERS.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2),
+                thread_name_prefix='product-images',
+            )
+        return _executor
+
+
+def variant_name(source_name, size, extension):
+    """
+    Name a variant is saved under, e.g. variants/combopack280/card.webp;
+    ContentAddressedStorage keeps the directory and names the file after
+    its content.
+    """
+    stem = posixpath.splitext(source_name)[0]
+    return posixpath.join('variants', stem, f'{size}.{extension}')
+
+
+def render_variants(image):
+    """
+    Resizes and re-encodes an opened Pillow image.
+
+    Yields:
+        tuple: (size, extension, encoded bytes) for every size and format
+    """
+    image = ImageOps.exif_transpose(image)
+    for size, edge in VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        for extension, (image_format, options) in VARIANT_FORMATS.items():
+            converted = resized
+            if image_format == 'JPEG' and resized.mode != 'RGB':
+                converted = resized.convert('RGB')
+            buffer = BytesIO()
+            converted.save(buffer, image_format, **options)
+            yield size, extension, buffer.getvalue()
+
+
+def generate_variants(product_id):
+    """
+    Builds every variant of a product's image and records their storage
+    names in Product.image_variants.
+
+    The result is only stored if the product still points at the same
+    image and variants, so a slow job never overwrites the variants of a
+    newer upload, and of two jobs racing on one image only the one that
+    wins the update moves the blob references.
+
+    Returns:
+        dict: The variants written, or None if there was nothing to do
+    """
+    from .models import Product
+
+    field = Product._meta.get_field('productimage')
+    row = Product.objects.filter(pk=product_id).values_list('productimage', 'image_variants').first()
+    if row is None:
+        return None
+    source, previous = row
+    if not source or not field.storage.exists(source):
+        return None
+
+    with field.storage.open(source, 'rb') as image_file:
+        with Image.open(image_file) as image:
+            image.load()
+            variants = {'source': source}
+            for size, extension, data in render_variants(image):
+                # Identical renders map to the same blob; the previous
+                # variants stay until release_blobs() drops their references
+                name = field.storage.save(variant_name(source, size, extension), ContentFile(data))
+                variants.setdefault(size, {})[extension] = name
+
+    with transaction.atomic():
+        current = Product.objects.filter(pk=product_id, productimage=source, image_variants=previous)
+        if not current.update(image_variants=variants):
+            return variants
+        retain_blobs(variant_names(variants))
+        release_blobs(variant_names(previous))
+    # update() skips post_save, which would otherwise invalidate the catalog
+    bump_catalog_version()
+    return variants
+
+
+def _run_in_worker(product_id):
+    try:
+        generate_variants(product_id)
+    except Exception:
+        logger.exception("Could not generate image variants for product %s", product_id)
+    finally:
+        # Worker threads get their own connection; don't leak it
+        connection.close()
+
+
+def schedule_variants(product_id):
+    """
+    Queues variant generation on the worker pool, or runs it inline when
+    PRODUCT_IMAGE_VARIANTS_ASYNC is False (tests, management commands).
+    """
+    if getattr(settings, 'PRODUCT_IMAGE_VARIANTS_ASYNC', True):
+        return get_executor().submit(_run_in_worker, product_id)
+    return generate_variants(product_id)
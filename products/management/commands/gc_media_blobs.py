@@ -0,0 +1,91 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product, StoredBlob
+from products.storage import get_product_image_storage, is_content_addressed, retain_blobs, variant_names
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes content-addressed product image files that no product references anymore. "
+        "Use --adopt to move legacy images (random-suffix names) into content-addressed "
+        "storage first, collapsing identical copies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=24,
+            help="Keep unreferenced files touched within this many hours (default: 24)",
+        )
+        parser.add_argument('--adopt', action='store_true', help="Rehash legacy product images into content-addressed names")
+        parser.add_argument('--recount', action='store_true', help="Rebuild reference counts from the product table")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting")
+
+    def handle(self, *args, **options):
+        storage = get_product_image_storage()
+        if options['adopt']:
+            self.adopt(storage, options['dry_run'])
+        if options['recount']:
+            self.recount()
+        self.sweep(storage, timedelta(hours=options['grace_hours']), options['dry_run'])
+
+    def adopt(self, storage, dry_run):
+        legacy = Counter()
+        adopted = 0
+        for pk, name in Product.objects.values_list('pk', 'productimage').iterator():
+            if not name or is_content_addressed(name) or not storage.exists(name):
+                continue
+            legacy[name] += 1
+            if dry_run:
+                continue
+            with storage.open(name, 'rb') as source:
+                hashed = storage.save(name, source)
+            if Product.objects.filter(pk=pk, productimage=name).update(productimage=hashed):
+                retain_blobs([hashed])
+                adopted += 1
+
+        if dry_run:
+            self.stdout.write(f"Would adopt {sum(legacy.values())} images stored in {len(legacy)} legacy files")
+            return
+        # Legacy files are unreferenced once every product using them moved
+        still_used = set(Product.objects.filter(productimage__in=legacy).values_list('productimage', flat=True))
+        for name in legacy:
+            if name not in still_used:
+                storage.delete(name)
+        self.stdout.write(f"Adopted {adopted} images, removed {len(set(legacy) - still_used)} legacy files")
+
+    def recount(self):
+        counts = Counter()
+        for image, image_variants in Product.objects.values_list('productimage', 'image_variants').iterator():
+            for name in [image, *variant_names(image_variants)]:
+                if is_content_addressed(name):
+                    counts[name] += 1
+
+        with transaction.atomic():
+            StoredBlob.objects.bulk_create([StoredBlob(name=name) for name in counts], ignore_conflicts=True)
+            blobs = list(StoredBlob.objects.select_for_update().only('pk', 'name', 'refcount'))
+            for blob in blobs:
+                blob.refcount = counts.get(blob.name, 0)
+            StoredBlob.objects.bulk_update(blobs, ['refcount'], batch_size=1000)
+        self.stdout.write(f"Recounted references for {len(blobs)} blobs")
+
+    def sweep(self, storage, grace, dry_run):
+        unreferenced = StoredBlob.objects.filter(refcount=0, updated_at__lt=timezone.now() - grace)
+        deleted = 0
+        for blob in unreferenced.iterator():
+            if dry_run:
+                self.stdout.write(f"Would delete {blob.name}")
+                continue
+            # Delete the row first, and only while it is still unreferenced, so
+            # a blob retained again since the query above keeps its file
+            if StoredBlob.objects.filter(pk=blob.pk, refcount=0).delete()[0]:
+                storage.delete(blob.name)
+                deleted += 1
+        if not dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unreferenced blobs"))
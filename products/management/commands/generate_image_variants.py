@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from products.images import generate_variants
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Builds resized WebP/JPEG variants for product images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild variants for every product")
+        parser.add_argument('--workers', type=int, default=4, help="Parallel image workers (default: 4)")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(productimage='').values_list('pk', 'productimage', 'image_variants')
+        pending = [
+            pk for pk, image, variants in products.iterator()
+            if options['all'] or variants.get('source') != image
+        ]
+        self.stdout.write(f"Building variants for {len(pending)} products")
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(self.build, pk): pk for pk in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Product {futures[future]}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {len(pending) - failed} products, {failed} failed"))
+
+    def build(self, pk):
+        try:
+            return generate_variants(pk)
+        finally:
+            connection.close()
@@ -0,0 +1,113 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.autocomplete import bump_autocomplete_version
+from products.cache import bump_catalog_version
+from products.models import Product
+from products.slugs import product_slugs
+from products.utils import calculate_discount_price
+
+REQUIRED_FIELDS = ('productname', 'productimage', 'packtitle', 'originalprice')
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams products from a CSV or JSONL file into the database with bulk inserts. "
+        "Columns: productname, productimage, packtitle, originalprice and optionally "
+        "description, discountPercentage, stock. Batches written before an invalid row "
+        "are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file to import")
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help="Input format, guessed from the file extension when omitted",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Number of products per INSERT (default: 1000)",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        started = time.monotonic()
+        created = 0
+        try:
+            with open(path, newline='', encoding='utf-8') as source:
+                rows = self.read_csv(source) if file_format == 'csv' else self.read_jsonl(source)
+                products = (self.build_product(line, row) for line, row in rows)
+                while True:
+                    batch = list(islice(products, batch_size))
+                    if not batch:
+                        break
+                    # One sequence reservation for the whole batch
+                    for product, slug in zip(batch, product_slugs.allocate(len(batch))):
+                        product.slug = slug
+                    Product.objects.bulk_create(batch)
+                    created += len(batch)
+                    self.stdout.write(f"Imported {created} products")
+        except OSError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        finally:
+            # bulk_create skips the post_save signal that normally invalidates the catalog
+            if created:
+                bump_catalog_version()
+                bump_autocomplete_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} products in {elapsed:.1f}s ({created / max(elapsed, 0.001):.0f}/s)"
+        ))
+
+    def read_csv(self, source):
+        # Line numbers start at 2 to account for the header row
+        for line, row in enumerate(csv.DictReader(source), start=2):
+            yield line, row
+
+    def read_jsonl(self, source):
+        for line, text in enumerate(source, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Line {line}: invalid JSON ({e})")
+
+    def build_product(self, line, row):
+        missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+        if missing:
+            raise CommandError(f"Line {line}: missing {', '.join(missing)}")
+        try:
+            originalprice = Decimal(str(row['originalprice']))
+            discountPercentage = Decimal(str(row.get('discountPercentage') or 0))
+            stock = int(row.get('stock') or 0)
+        except (InvalidOperation, ValueError):
+            raise CommandError(f"Line {line}: invalid price, discount or stock")
+        if not 0 <= discountPercentage <= 100 or stock < 0:
+            raise CommandError(f"Line {line}: discount must be 0-100 and stock positive")
+
+        # Same values Product.save would compute, without its per-row query
+        return Product(
+            productname=row['productname'],
+            productimage=row['productimage'],
+            packtitle=row['packtitle'],
+            description=row.get('description') or None,
+            originalprice=originalprice,
+            discountPercentage=discountPercentage,
+            discountPrice=calculate_discount_price(originalprice, discountPercentage),
+            stock=stock,
+        )
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from products.orders import process_pending_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs pending orders through ORDER_PROCESSING_HANDLER on a pool of worker "
+        "threads and records their status transitions. Runs in a loop every "
+        "--interval seconds; use --once from cron instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2, help="Seconds between polls (default: 2)")
+        parser.add_argument('--batch-size', type=int, help="Orders claimed at a time (default: ORDER_PROCESSING_BATCH_SIZE)")
+        parser.add_argument('--workers', type=int, help="Handler threads (default: ORDER_PROCESSING_WORKERS)")
+        parser.add_argument('--once', action='store_true', help="Process what is due and exit")
+
+    def handle(self, *args, **options):
+        for option in ('batch_size', 'workers'):
+            if options[option] is not None and options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1")
+        while True:
+            close_old_connections()
+            completed, failed, retried = process_pending_orders(options['batch_size'], options['workers'])
+            if completed or failed or retried or options['verbosity'] > 1:
+                self.stdout.write(f"Completed {completed} orders, {failed} failed, {retried} to retry")
+            if options['once']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
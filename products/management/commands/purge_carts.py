@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from products.models import Cart, CartItems
+from products.reservations import release_carts
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes carts (and their items) that have not been used for longer than "
+        "CART_TTL and releases the stock they reserved. Works in small transactions with a pause in between, so it can "
+        "run against the live database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-days', type=float, help="Override CART_TTL, in days")
+        parser.add_argument('--batch-size', type=int, default=500, help="Carts deleted per transaction (default: 500)")
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help="Seconds to pause between transactions (default: 0.1)",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only count the expired carts")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+        ttl = timedelta(days=options['ttl_days']) if options['ttl_days'] is not None else settings.CART_TTL
+        # Fixed for the whole run, so carts that expire meanwhile wait for
+        # the next one
+        expired = Cart.objects.expired(ttl, now=timezone.now())
+
+        if options['dry_run']:
+            self.stdout.write(f"{expired.count()} carts idle for more than {ttl}")
+            return
+
+        started = time.monotonic()
+        carts = items = released = 0
+        while True:
+            picked, deleted_carts, deleted_items, released_reservations = self.delete_batch(expired, batch_size)
+            if not picked:
+                break
+            carts += deleted_carts
+            items += deleted_items
+            released += released_reservations
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Deleted {carts} carts, {items} items")
+            time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {carts} carts and {items} items, released {released} reservations in {elapsed:.1f}s "
+            f"({carts / max(elapsed, 0.001):.0f} carts/s)"
+        ))
+
+    def delete_batch(self, expired, batch_size):
+        """
+        Returns:
+            tuple: (carts picked, carts deleted, items deleted, reservations
+            released). Fewer deleted than picked only means some carts were
+            used meanwhile, not that the expired ones have run out.
+        """
+        with transaction.atomic():
+            # Oldest first, through the updated_at index. The filter is
+            # applied again while deleting, so a cart used since it was
+            # picked is kept.
+            batch = expired.order_by('updated_at')
+            if connection.features.has_select_for_update_skip_locked:
+                batch = batch.select_for_update(skip_locked=True)
+            ids = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return 0, 0, 0, 0
+            _, deleted = expired.filter(pk__in=ids).delete()
+            # Carts used since they were picked survive and keep their stock
+            kept = set(Cart.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            released = release_carts([pk for pk in ids if pk not in kept])
+        return len(ids), deleted.get(Cart._meta.label, 0), deleted.get(CartItems._meta.label, 0), released
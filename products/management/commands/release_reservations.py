@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from products.reservations import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Hands expired StockReservation holds back to Product.reserved. Runs in a "
+        "loop every --interval seconds; use --once from cron instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=30, help="Seconds between ticks (default: 30)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Reservations released per transaction (default: 500)")
+        parser.add_argument('--once', action='store_true', help="Run a single tick and exit")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        while True:
+            close_old_connections()
+            released = 0
+            while True:
+                count = release_expired_reservations(batch_size=options['batch_size'])
+                released += count
+                if count < options['batch_size']:
+                    break
+            if released or options['verbosity'] > 1:
+                self.stdout.write(f"Released {released} expired reservations")
+            if options['once']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
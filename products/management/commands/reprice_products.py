@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.pricing import preview_repricing, reprice_products
+from products.seializers import RepriceProductsSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Sets the discount percentage of a selection of products and recomputes "
+        "discountPrice in a single SQL UPDATE. Without filters the whole catalog is repriced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('percentage', help="New discount percentage (0-100)")
+        parser.add_argument('--ids', nargs='+', type=int, help="Only these product ids")
+        parser.add_argument('--search', help="Only products whose name or pack title contains this text")
+        parser.add_argument('--min-price', help="Only products with originalprice >= this")
+        parser.add_argument('--max-price', help="Only products with originalprice <= this")
+        parser.add_argument('--dry-run', action='store_true', help="Report the price changes without writing them")
+
+    def handle(self, *args, **options):
+        data = {'discountPercentage': options['percentage']}
+        for option, field in (('ids', 'ids'), ('search', 'search'), ('min_price', 'min_price'), ('max_price', 'max_price')):
+            if options[option] is not None:
+                data[field] = options[option]
+        serializer = RepriceProductsSerializer(data=data)
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+        queryset = serializer.get_queryset()
+        discountPercentage = serializer.validated_data['discountPercentage']
+
+        if options['dry_run']:
+            affected = 0
+            for change in preview_repricing(queryset, discountPercentage):
+                affected += 1
+                self.stdout.write(
+                    f"{change['id']}\t{change['productname']}\t"
+                    f"{change['discountPrice']} -> {change['new_price']} ({change['delta']:+})"
+                )
+            self.stdout.write(self.style.WARNING(f"Dry run: {affected} products would be repriced"))
+            return
+
+        updated = reprice_products(queryset, discountPercentage)
+        self.stdout.write(self.style.SUCCESS(f"Repriced {updated} products to {discountPercentage}% off"))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from products.pricing import apply_discount_schedules
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies DiscountSchedule windows to Product.discountPrice. Runs in a loop "
+        "every --interval seconds; use --once from cron instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=60, help="Seconds between ticks (default: 60)")
+        parser.add_argument('--once', action='store_true', help="Run a single tick and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            changed = apply_discount_schedules()
+            if changed or options['verbosity'] > 1:
+                self.stdout.write(f"Updated {changed} product prices")
+            if options['once']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,233 @@
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import connections, models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+TOTAL_FIELD = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+class ProductQuerySet(models.QuerySet):
+    def decrement_stock(self, quantities, held=None):
+        """
+        Takes stock off several products in a single conditional UPDATE.
+
+        A row is only touched while it still holds enough stock that is not
+        reserved for other carts, so the statement can never drive stock
+        below zero or sell reserved units, even under concurrent checkouts.
+
+        Args:
+            quantities (dict): Mapping of product id to quantity to remove
+            held (dict): Mapping of product id to the quantity reserved for
+                this checkout; it leaves the reserved counter as the stock
+                is taken
+
+        Returns:
+            int: Number of products updated. Anything less than
+            len(quantities) means at least one product ran out of stock.
+        """
+        if not quantities:
+            return 0
+        held = held or {}
+        in_stock = reduce(or_, (
+            Q(pk=pk, stock__gte=F('reserved') + (quantity - held.get(pk, 0)))
+            for pk, quantity in quantities.items()
+        ))
+        return self.filter(in_stock).update(
+            stock=Case(
+                *(When(pk=pk, then=F('stock') - quantity) for pk, quantity in quantities.items()),
+                default=F('stock'),
+                output_field=models.PositiveIntegerField(),
+            ),
+            reserved=Case(
+                *(When(pk=pk, then=F('reserved') - quantity) for pk, quantity in held.items()),
+                default=F('reserved'),
+                output_field=models.PositiveIntegerField(),
+            ),
+        )
+
+    def restock(self, quantities):
+        """Puts quantities back on the stock of several products in one UPDATE."""
+        if not quantities:
+            return 0
+        return self.filter(pk__in=quantities).update(
+            stock=Case(
+                *(When(pk=pk, then=F('stock') + quantity) for pk, quantity in quantities.items()),
+                default=F('stock'),
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+
+    def reserve(self, quantities):
+        """
+        Adds to the reserved counters in one conditional UPDATE, only where
+        stock - reserved still covers the quantity.
+
+        Returns:
+            int: Number of products updated; less than len(quantities) means
+            some were short and the caller must roll back
+        """
+        if not quantities:
+            return 0
+        available = reduce(or_, (
+            Q(pk=pk, stock__gte=F('reserved') + quantity) for pk, quantity in quantities.items()
+        ))
+        return self.filter(available).update(
+            reserved=Case(
+                *(When(pk=pk, then=F('reserved') + quantity) for pk, quantity in quantities.items()),
+                default=F('reserved'),
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+
+    def unreserve(self, quantities):
+        """Takes quantities off the reserved counters, never below zero."""
+        if not quantities:
+            return 0
+        return self.filter(pk__in=quantities).update(
+            reserved=Case(
+                *(
+                    When(pk=pk, reserved__gte=quantity, then=F('reserved') - quantity)
+                    for pk, quantity in quantities.items()
+                ),
+                default=Value(0),
+                output_field=models.PositiveIntegerField(),
+            )
+        )
+
+
+class CartQuerySet(models.QuerySet):
+    def touch(self, cart_id):
+        """
+        Marks a cart as used now and brings its item_count and total up to
+        date. Item changes go through their own table (some with raw SQL or
+        bulk upserts), so they call this in the same transaction.
+        """
+        return self.filter(pk=cart_id).refresh_totals(updated_at=timezone.now())
+
+    def refresh_totals(self, **fields):
+        """
+        Recomputes item_count and total of every cart in the queryset from
+        its items at current prices, in one UPDATE.
+
+        Args:
+            **fields: Other columns to set in the same statement
+        """
+        items = (
+            self.model._meta.get_field('items').related_model.objects
+            .filter(cart=OuterRef('pk'), product__isnull=False)
+            .order_by()
+            .values('cart')
+        )
+        item_count = items.annotate(count=Sum('quantity')).values('count')
+        total = items.annotate(
+            total=Sum(F('quantity') * F('product__discountPrice'), output_field=TOTAL_FIELD)
+        ).values('total')
+        return self.update(
+            item_count=Coalesce(Subquery(item_count), 0),
+            total=Coalesce(Subquery(total, output_field=TOTAL_FIELD), Value(Decimal('0.00')), output_field=TOTAL_FIELD),
+            **fields
+        )
+
+    def containing(self, products):
+        """Carts holding any of `products` (ids or a Product queryset)."""
+        items = self.model._meta.get_field('items').related_model.objects
+        return self.filter(pk__in=items.filter(product__in=products).values('cart_id'))
+
+    def expired(self, ttl, now=None):
+        """Carts untouched for longer than `ttl` (a timedelta)."""
+        return self.filter(updated_at__lt=(now or timezone.now()) - ttl)
+
+
+class CartItemsQuerySet(models.QuerySet):
+    def add_quantity(self, cart_id, product_id, quantity):
+        """
+        Adds `quantity` of a product to a cart in one atomic upsert.
+
+        On SQLite and PostgreSQL this is a single
+        INSERT ... SELECT ... ON CONFLICT (cart_id, product_id) DO UPDATE
+        statement, so concurrent adds of the same product add up instead of
+        creating duplicate rows. Relies on the unique (cart, product)
+        constraint. The update only happens while the sum stays within
+        MAX_QUANTITY.
+
+        Returns:
+            CartItems: The inserted or updated item, or None when the cart
+            or the product does not exist
+
+        Raises:
+            QuantityTooLarge: The item would end up above MAX_QUANTITY
+        """
+        from .carts import MAX_QUANTITY, QuantityTooLarge
+
+        if quantity > MAX_QUANTITY:
+            raise QuantityTooLarge([product_id])
+        connection = connections[self.db]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            return self._add_quantity_locked(cart_id, product_id, quantity)
+
+        opts = self.model._meta
+        cart_field = opts.get_field('cart')
+        product_field = opts.get_field('product')
+        quantity_column = opts.get_field('quantity').column
+        cart_model = cart_field.related_model._meta
+        product_model = product_field.related_model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        # Selecting from cart and product means nothing is written when
+        # either row is missing
+        sql = (
+            f"INSERT INTO {table} ({qn(cart_field.column)}, {qn(product_field.column)}, {qn(quantity_column)}) "
+            f"SELECT c.{qn(cart_model.pk.column)}, p.{qn(product_model.pk.column)}, %s "
+            f"FROM {qn(cart_model.db_table)} c, {qn(product_model.db_table)} p "
+            f"WHERE c.{qn(cart_model.pk.column)} = %s AND p.{qn(product_model.pk.column)} = %s "
+            f"ON CONFLICT ({qn(cart_field.column)}, {qn(product_field.column)}) "
+            f"DO UPDATE SET {qn(quantity_column)} = {table}.{qn(quantity_column)} + EXCLUDED.{qn(quantity_column)} "
+            f"WHERE {table}.{qn(quantity_column)} + EXCLUDED.{qn(quantity_column)} <= %s "
+            f"RETURNING {qn(opts.pk.column)}, {qn(quantity_column)}"
+        )
+        params = [
+            quantity,
+            cart_field.get_db_prep_value(cart_id, connection),
+            product_field.get_db_prep_value(product_id, connection),
+            MAX_QUANTITY,
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            # Either nothing to insert into, or the existing item is full
+            if self.filter(cart_id=cart_id, product_id=product_id).exists():
+                raise QuantityTooLarge([product_id])
+            return None
+
+        pk, new_quantity = row
+        item = self.model(pk=pk, cart_id=cart_id, product_id=product_id, quantity=new_quantity)
+        item._state.adding = False
+        item._state.db = self.db
+        return item
+
+    def _add_quantity_locked(self, cart_id, product_id, quantity):
+        # Fallback for backends without ON CONFLICT support
+        from .carts import MAX_QUANTITY, QuantityTooLarge
+
+        cart_model = self.model._meta.get_field('cart').related_model
+        product_model = self.model._meta.get_field('product').related_model
+        with transaction.atomic(using=self.db):
+            if not (
+                cart_model.objects.filter(pk=cart_id).exists()
+                and product_model.objects.filter(pk=product_id).exists()
+            ):
+                return None
+            item, created = self.select_for_update().get_or_create(
+                cart_id=cart_id, product_id=product_id, defaults={'quantity': quantity}
+            )
+            if not created:
+                if item.quantity + quantity > MAX_QUANTITY:
+                    raise QuantityTooLarge([product_id])
+                self.filter(pk=item.pk).update(quantity=F('quantity') + quantity)
+                item.refresh_from_db(fields=['quantity'])
+        return item
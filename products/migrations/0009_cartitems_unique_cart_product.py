@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:16
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Fold duplicate (cart, product) rows into the oldest one before the
+    # unique constraint is added
+    CartItems = apps.get_model('products', 'CartItems')
+    duplicates = (
+        CartItems.objects.values('cart_id', 'product_id')
+        .annotate(rows=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        items = CartItems.objects.filter(cart_id=duplicate['cart_id'], product_id=duplicate['product_id'])
+        items.exclude(pk=duplicate['keep']).delete()
+        items.filter(pk=duplicate['keep']).update(quantity=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_orderitem_unit_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitems',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_cartitems_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discountPercentage', models.DecimalField(decimal_places=2, help_text='Discount percentage (0-100) while the window is open', max_digits=5)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('S', 'Scheduled'), ('A', 'Active'), ('F', 'Finished')], default='S', max_length=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discount_schedules', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'starts_at'], name='discount_status_starts_idx'), models.Index(fields=['status', 'ends_at'], name='discount_status_ends_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:32
+
+import base64
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+
+
+def slug_for(number):
+    # Frozen copy of products.slugs.slug_for(): the keyed Feistel
+    # permutation of the sequence number, base64 encoded
+    key = (getattr(settings, 'PRODUCT_SLUG_SECRET_KEY', None) or settings.SECRET_KEY).encode()
+    left, right = number >> 32, number & 0xFFFFFFFF
+    for round_number in range(4):
+        digest = hmac.new(key, f'{round_number}:{right}'.encode(), hashlib.sha256).digest()
+        left, right = right, left ^ int.from_bytes(digest[:4], 'big')
+    value = (left << 32) | right
+    return base64.urlsafe_b64encode(value.to_bytes(8, 'big')).decode().rstrip('=')
+
+
+def fix_duplicate_slugs(apps, schema_editor):
+    # Missing slugs, and every copy of a duplicated one except the oldest,
+    # get a fresh slug from the sequence before the unique index is built
+    Product = apps.get_model('products', 'Product')
+    SlugSequence = apps.get_model('products', 'SlugSequence')
+    duplicated = (
+        Product.objects.exclude(slug__isnull=True).exclude(slug='')
+        .values('slug').annotate(rows=Count('id')).filter(rows__gt=1).values('slug')
+    )
+    keep = {
+        slug: pk
+        for pk, slug in Product.objects.filter(slug__in=duplicated).order_by('-id').values_list('id', 'slug')
+    }
+    products = list(
+        Product.objects.filter(Q(slug__isnull=True) | Q(slug='') | Q(slug__in=duplicated))
+        .exclude(id__in=keep.values())
+        .order_by('id')
+    )
+    if not products:
+        return
+    SlugSequence.objects.get_or_create(name='product')
+    SlugSequence.objects.filter(name='product').update(next_value=F('next_value') + len(products))
+    end = SlugSequence.objects.get(name='product').next_value
+    for number, product in zip(range(end - len(products), end), products):
+        product.slug = slug_for(number)
+    Product.objects.bulk_update(products, ['slug'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fix_duplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:41
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_cart_totals(apps, schema_editor):
+    # Same UPDATE as CartQuerySet.refresh_totals() at the time, on the
+    # historical models
+    Cart = apps.get_model('products', 'Cart')
+    CartItems = apps.get_model('products', 'CartItems')
+    total_field = models.DecimalField(max_digits=12, decimal_places=2)
+    items = (
+        CartItems.objects
+        .filter(cart=OuterRef('pk'), product__isnull=False)
+        .order_by()
+        .values('cart')
+    )
+    item_count = items.annotate(count=Sum('quantity')).values('count')
+    total = items.annotate(
+        total=Sum(F('quantity') * F('product__discountPrice'), output_field=total_field)
+    ).values('total')
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(item_count), 0),
+        total=Coalesce(Subquery(total, output_field=total_field), Value(Decimal('0.00')), output_field=total_field),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.1.7 on 2026-10-17 21:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def queue_legacy_orders(apps, schema_editor):
+    # Orders still pending here were never processed. Those stored with the
+    # old default (the constant's name instead of 'P') become 'P' too, so
+    # process_orders picks all of them up; the first transition records
+    # where they came from.
+    Order = apps.get_model('products', 'Order')
+    OrderTransition = apps.get_model('products', 'OrderTransition')
+    legacy = Order.objects.filter(pending_status__in=['PAYMENT_STATUS_PENDING', 'P'])
+    ids = list(legacy.values_list('pk', flat=True))
+    legacy.update(pending_status='P')
+    OrderTransition.objects.bulk_create(
+        [
+            OrderTransition(order_id=pk, from_status='', to_status='P', note="Placed before order processing existed")
+            for pk in ids
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_cart_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('P', 'Pending'), ('C', 'Completed'), ('F', 'Failed')], max_length=1)),
+                ('to_status', models.CharField(choices=[('P', 'Pending'), ('C', 'Completed'), ('F', 'Failed')], max_length=1)),
+                ('note', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_pending_status_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='last_error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='pending_status',
+            field=models.CharField(choices=[('P', 'Pending'), ('C', 'Completed'), ('F', 'Failed')], default='P', max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['pending_status', 'next_attempt_at'], name='order_status_next_idx'),
+        ),
+        migrations.AddField(
+            model_name='ordertransition',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transitions', to='products.order'),
+        ),
+        migrations.AddIndex(
+            model_name='ordertransition',
+            index=models.Index(fields=['order', 'created_at'], name='transition_order_created_idx'),
+        ),
+        migrations.RunPython(queue_legacy_orders, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,22 @@
 from statistics import mode
 import uuid
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.utils.text import slugify
-from .utils import generate_unique_slug
+from django.utils import timezone
+from .managers import CartItemsQuerySet, CartQuerySet, ProductQuerySet
+from .storage import get_product_image_storage
+from .slugs import product_slugs
+from .utils import calculate_discount_price
 
 class Product(models.Model):
     productname = models.CharField(max_length=100)
-    slug = models.SlugField(blank=True, null=True)
-    productimage = models.ImageField()
+    # Generated from products.slugs on insert; the unique index serves the
+    # ProductViewSet lookups
+    slug = models.SlugField(blank=True, null=True, unique=True)
+    productimage = models.ImageField(storage=get_product_image_storage)
+    # Storage names of the resized copies built by products.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     packtitle = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     originalprice = models.DecimalField(max_digits=10, decimal_places=2)
@@ -26,46 +34,210 @@ class Product(models.Model):
         help_text="Calculated discounted price"
     )
     stock = models.PositiveIntegerField(default=0)
+    # Units held by StockReservation rows; stock - reserved can be sold.
+    # Only changed by the conditional UPDATEs in ProductQuerySet
+    reserved = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Product"
         verbose_name_plural = "Products"
+        # Used by products.filters.ProductFilter. on_sale and in_stock read
+        # their rows in cursor order (id); the price and discount ranges
+        # scan their index and sort the matches by id
+        indexes = [
+            models.Index(fields=['discountPrice'], name='product_discount_price_idx'),
+            models.Index(fields=['discountPercentage'], name='product_discount_pct_idx'),
+            models.Index(fields=['stock', 'id'], name='product_stock_id_idx'),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(stock__gt=0),
+                name='product_in_stock_idx',
+            ),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(discountPrice__lt=models.F('originalprice')),
+                name='product_on_sale_idx',
+            ),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so the signals can move blob references
+        # when it is replaced
+        if 'productimage' in field_names:
+            instance._loaded_productimage = instance.productimage.name
+        # Values the signals compare against to skip work when a save did
+        # not touch them
+        instance._loaded_values = instance.tracked_values()
+        return instance
+    
+    TRACKED_FIELDS = ('slug', 'productname', 'packtitle', 'discountPrice')
+    
+    def tracked_values(self):
+        return {name: self.__dict__[name] for name in self.TRACKED_FIELDS if name in self.__dict__}
+    
+    def has_changed(self, *names):
+        """Whether any of `names` differs from what was loaded (always True for new objects)."""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(name not in loaded or loaded[name] != getattr(self, name) for name in names)
     
     def save(self, *args, **kwargs):
-        # Generate a basic slug from the product name
-        if not self.slug:
-            base_slug = slugify(self.productname)
-            # Now encrypt it
-            self.slug = generate_unique_slug(Product, base_slug)
-        # For existing products being updated
-        elif not self.id:
-            base_slug = slugify(self.productname)
-            self.slug = generate_unique_slug(Product, base_slug, self.id)
+        # New products get the next slug of the sequence, unique by
+        # construction, so no lookup is needed
+        if not self.slug or not self.id:
+            self.slug = product_slugs.allocate()[0]
             
         # Calculate and set discountPrice before saving
-        if self.discountPercentage > 0:
-            discount = self.originalprice * (self.discountPercentage / 100)
-            self.discountPrice = round(self.originalprice - discount, 2)
-        else:
-            self.discountPrice = self.originalprice
+        self.discountPrice = calculate_discount_price(self.originalprice, self.discountPercentage)
+        
+        # Never write back a reserved counter read before concurrent carts
+        # changed it
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'reserved'
+            ]
             
         super().save(*args, **kwargs)
+        self._loaded_values = self.tracked_values()
     
     def __str__(self):
         return self.productname
     
+    @property
+    def available(self):
+        """Stock that is not reserved by any cart"""
+        return max(self.stock - self.reserved, 0)
+    
     # Optional: Calculate the discount amount
     @property
     def discountAmount(self):
         """Calculate the amount saved"""
-        if self.discountPercentage > 0:
+        # discountPrice may also come from an active DiscountSchedule
+        if self.discountPrice is not None and self.discountPrice < self.originalprice:
             return round(self.originalprice - self.discountPrice, 2)
         return 0.00
     
+
+class DiscountSchedule(models.Model):
+    """
+    A time-boxed discount for one product.
+
+    The run_discount_scheduler command moves schedules through
+    Scheduled -> Active -> Finished and rewrites Product.discountPrice in
+    bulk when a window opens or closes, so reads never evaluate schedules.
+    """
+    STATUS_SCHEDULED = 'S'
+    STATUS_ACTIVE = 'A'
+    STATUS_FINISHED = 'F'
+    
+    STATUS_CHOICES = [
+        (STATUS_SCHEDULED, 'Scheduled'),
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_FINISHED, 'Finished'),
+    ]
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="discount_schedules")
+    discountPercentage = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        help_text="Discount percentage (0-100) while the window is open"
+    )
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_SCHEDULED)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'starts_at'], name='discount_status_starts_idx'),
+            models.Index(fields=['status', 'ends_at'], name='discount_status_ends_idx'),
+        ]
+    
+    def clean(self):
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': "The window must end after it starts"})
+        if self.discountPercentage is not None and not 0 <= self.discountPercentage <= 100:
+            raise ValidationError({'discountPercentage': "Discount percentage must be between 0 and 100"})
+    
+    def __str__(self):
+        return f"{self.discountPercentage}% off {self.product} ({self.starts_at} - {self.ends_at})"
+    
+class StoredBlob(models.Model):
+    """
+    A file written by ContentAddressedStorage and how many product images
+    or image variants point at it. Blobs left at zero references are
+    deleted by `manage.py gc_media_blobs`.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at'], name='storedblob_refcount_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+    
+class StockReservation(models.Model):
+    """
+    Stock held for one cart. The cart's quantity of the product is kept
+    here and added to Product.reserved; `manage.py release_reservations`
+    hands it back once `expires_at` has passed. cart_id is not a foreign
+    key because carts may live outside the database (see products.carts).
+    """
+    cart_id = models.UUIDField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reservations")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart_id', 'product'], name='unique_reservation_cart_product'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for cart {self.cart_id} until {self.expires_at}"
+    
+class SlugSequence(models.Model):
+    """
+    High-water mark of a slug sequence. products.slugs.SlugAllocator
+    reserves numbers from it in blocks.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+    
 class Cart(models.Model):
     id = models.UUIDField(default=uuid.uuid4,editable=False,primary_key=True)
     created = models.DateTimeField(auto_now_add=True)
+    # Last use; carts idle for longer than CART_TTL are deleted by
+    # `manage.py purge_carts`
     updated_at = models.DateTimeField(auto_now=True)
+    # Units and value of the items at current prices, kept up to date by
+    # CartQuerySet.touch() on every item change and refresh_totals() when
+    # prices change
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    
+    objects = CartQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='cart_updated_at_idx'),
+        ]
+    
     def __str__(self):
         return str(self.id)
     
@@ -74,12 +246,23 @@ class CartItems(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, blank=True, null=True, related_name="cartitems", db_index=True)
     quantity = models.PositiveSmallIntegerField(default=0)
     
+    objects = CartItemsQuerySet.as_manager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
     
     def __str__(self):
         return f"{self.quantity} x {self.product.productname} in cart {self.cart.id}"
     
     
 class Order(models.Model):
+    """
+    Checkout creates orders as Pending; `manage.py process_orders` runs
+    them through ORDER_PROCESSING_HANDLER and moves them to Completed or
+    Failed, recording every change as an OrderTransition.
+    """
     PAYMENT_STATUS_PENDING = 'P'
     PAYMENT_STATUS_COMPLETE = 'C'
     PAYMENT_STATUS_FAILD = 'F'
@@ -93,17 +276,51 @@ class Order(models.Model):
     pending_status = models.CharField(
         max_length=50,
         choices=PAYMENT_STATUS_CHOICES,
-        default='PAYMENT_STATUS_PENDING',
+        default=PAYMENT_STATUS_PENDING,
     )
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    # Processing attempts so far, when the next one is due and why the
+    # last one failed (see products.orders)
+    attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    next_attempt_at = models.DateTimeField(default=timezone.now, editable=False)
+    last_error = models.TextField(blank=True, editable=False)
+    
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination in OrderCursorPagination
+            models.Index(fields=['placed_at', 'id'], name='order_placed_at_id_idx'),
+            # A customer's order history, newest first
+            models.Index(fields=['owner', 'placed_at'], name='order_owner_placed_at_idx'),
+            # Due pending orders for the processing workers; also serves
+            # staff views filtered by payment status
+            models.Index(fields=['pending_status', 'next_attempt_at'], name='order_status_next_idx'),
+        ]
     
     def __str__(self):
         return self.pending_status
     
+class OrderTransition(models.Model):
+    """One status change of an order; from_status is blank at checkout."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="transitions")
+    from_status = models.CharField(max_length=1, choices=Order.PAYMENT_STATUS_CHOICES, blank=True)
+    to_status = models.CharField(max_length=1, choices=Order.PAYMENT_STATUS_CHOICES)
+    note = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'created_at'], name='transition_order_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status or '-'} -> {self.to_status}"
+    
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, )
     quantity = models.PositiveSmallIntegerField()
+    # Price paid per unit, copied from Product.discountPrice at checkout
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     
     def __str__(self):
         return self.product.productname
\ No newline at end of file
@@ -0,0 +1,201 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import bump_catalog_version
+from .models import Order, OrderItem, OrderTransition, Product
+
+logger = logging.getLogger(__name__)
+
+# How long a claimed order is kept from other workers; renewed while its
+# handler is still running
+LEASE = timedelta(minutes=5)
+
+
+class OrderRejected(Exception):
+    """Raised by a handler when an order can never succeed, e.g. a declined payment."""
+
+
+class BaseOrderHandler:
+    """
+    Runs the downstream steps of one order (payment, fulfilment, ...).
+
+    process() returns normally when the order is done and raises
+    OrderRejected to fail it for good. Any other exception is retried with
+    backoff until ORDER_PROCESSING_MAX_ATTEMPTS. It is called from worker
+    threads, with the order's items and their products already loaded.
+
+    `idempotency_key` is the same for every attempt at an order; pass it
+    to payment and fulfilment services so a retried or re-claimed order is
+    never charged or shipped twice. order.attempts tells attempts apart.
+    """
+
+    def process(self, order, idempotency_key):
+        raise NotImplementedError
+
+
+class StubOrderHandler(BaseOrderHandler):
+    """Completes every order; for local development and tests."""
+
+    def process(self, order, idempotency_key):
+        logger.info("Processed order %s (%s items, key %s)", order.pk, len(order.items.all()), idempotency_key)
+
+
+def get_order_handler():
+    return import_string(getattr(settings, 'ORDER_PROCESSING_HANDLER', 'products.orders.StubOrderHandler'))()
+
+
+def idempotency_key(order):
+    return f"order-{order.pk}"
+
+
+def record_transition(order_id, from_status, to_status, note=''):
+    return OrderTransition.objects.create(order_id=order_id, from_status=from_status, to_status=to_status, note=note)
+
+
+def retry_delay(attempts):
+    """Exponential backoff: ORDER_PROCESSING_RETRY_DELAY seconds, doubled per attempt."""
+    base = getattr(settings, 'ORDER_PROCESSING_RETRY_DELAY', 30)
+    return timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def claim_orders(batch_size, lease):
+    """
+    Reserves up to `batch_size` due pending orders for this worker by
+    pushing their next attempt `lease` into the future, so parallel workers
+    skip them and a crashed worker's orders come back after the lease.
+    """
+    now = timezone.now()
+    due = Order.objects.filter(pending_status=Order.PAYMENT_STATUS_PENDING, next_attempt_at__lte=now)
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:batch_size])
+        Order.objects.filter(pk__in=ids).update(attempts=F('attempts') + 1, next_attempt_at=now + lease)
+    return list(
+        Order.objects.filter(pk__in=ids)
+        .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product')))
+        .order_by('next_attempt_at', 'id')
+    )
+
+
+def renew_leases(orders):
+    """Extends the lease of orders whose handler is still running."""
+    held = reduce(or_, (Q(pk=order.pk, attempts=order.attempts) for order in orders))
+    return Order.objects.filter(held, pending_status=Order.PAYMENT_STATUS_PENDING).update(
+        next_attempt_at=timezone.now() + LEASE
+    )
+
+
+def leased(order):
+    """
+    The order while this worker still holds it. Claiming increments
+    `attempts`, so a matching count means nobody claimed it since.
+    """
+    return Order.objects.filter(pk=order.pk, pending_status=Order.PAYMENT_STATUS_PENDING, attempts=order.attempts)
+
+
+def _run(handler, order):
+    try:
+        handler.process(order, idempotency_key(order))
+    except Exception as e:
+        return e
+    finally:
+        connection.close()
+    return None
+
+
+def complete_order(order):
+    """
+    Marks an order Completed.
+
+    Returns:
+        bool: False when the lease was lost and the result discarded
+    """
+    with transaction.atomic():
+        if not leased(order).update(pending_status=Order.PAYMENT_STATUS_COMPLETE, last_error=''):
+            return False
+        record_transition(order.pk, Order.PAYMENT_STATUS_PENDING, Order.PAYMENT_STATUS_COMPLETE)
+    return True
+
+
+def fail_order(order, error):
+    """
+    Marks an order Failed and puts its items back in stock.
+
+    Returns:
+        bool: False when the lease was lost and the result discarded
+    """
+    with transaction.atomic():
+        if not leased(order).update(pending_status=Order.PAYMENT_STATUS_FAILD, last_error=str(error)):
+            return False
+        record_transition(order.pk, Order.PAYMENT_STATUS_PENDING, Order.PAYMENT_STATUS_FAILD, str(error))
+        quantities = {}
+        for item in order.items.all():
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        # Cached catalog pages only change when a product returns to the
+        # ?in_stock= results
+        if Product.objects.filter(pk__in=quantities, stock=0).exists():
+            transaction.on_commit(bump_catalog_version)
+        Product.objects.restock(quantities)
+    return True
+
+
+def retry_order(order, error):
+    return bool(leased(order).update(
+        last_error=str(error),
+        next_attempt_at=timezone.now() + retry_delay(order.attempts),
+    ))
+
+
+def process_pending_orders(batch_size=None, workers=None):
+    """
+    Runs every due pending order through ORDER_PROCESSING_HANDLER,
+    `batch_size` at a time on a pool of `workers` threads. Results are
+    written from the calling thread, one short transaction per order, and
+    only while the order's lease is still held; the lease is renewed while
+    handlers run.
+
+    Returns:
+        tuple: (completed, failed, retried) counts
+    """
+    batch_size = batch_size or getattr(settings, 'ORDER_PROCESSING_BATCH_SIZE', 50)
+    workers = workers or getattr(settings, 'ORDER_PROCESSING_WORKERS', 4)
+    max_attempts = getattr(settings, 'ORDER_PROCESSING_MAX_ATTEMPTS', 5)
+    handler = get_order_handler()
+    completed = failed = retried = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='order-processing') as executor:
+        while True:
+            batch = claim_orders(batch_size, LEASE)
+            if not batch:
+                return completed, failed, retried
+
+            running = {executor.submit(_run, handler, order): order for order in batch}
+            while running:
+                done, _ = wait(running, timeout=LEASE.total_seconds() / 3)
+                for future in done:
+                    order, error = running.pop(future), future.result()
+                    if error is None:
+                        recorded = complete_order(order)
+                        completed += recorded
+                    elif isinstance(error, OrderRejected) or order.attempts >= max_attempts:
+                        logger.warning("Order %s failed (attempt %s): %s", order.pk, order.attempts, error)
+                        recorded = fail_order(order, error)
+                        failed += recorded
+                    else:
+                        logger.warning("Order %s will be retried (attempt %s): %s", order.pk, order.attempts, error)
+                        recorded = retry_order(order, error)
+                        retried += recorded
+                    if not recorded:
+                        logger.warning("Lost the lease on order %s; result of attempt %s discarded", order.pk, order.attempts)
+                if running:
+                    renew_leases(running.values())
@@ -0,0 +1,36 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the product primary key.
+    Pages are fetched with `WHERE id > cursor` so there is no COUNT(*) and
+    no OFFSET scan, whatever the table size.
+    """
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination for order history, newest first.
+    The `id` tie-breaker keeps the ordering unique for orders placed at the
+    same instant.
+    """
+    ordering = ('-placed_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ProductSearchPagination(PageNumberPagination):
+    """
+    Pagination for `?q=` search results. They are ordered by relevance, which
+    a cursor cannot encode, and capped at PRODUCT_SEARCH_MAX_RESULTS, so
+    counting and offsetting them stays cheap.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
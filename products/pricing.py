@@ -0,0 +1,165 @@
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, ExpressionWrapper, F, Max, Value, When
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+
+CENT = Decimal('0.01')
+PERCENT = Value(Decimal('0.01'), output_field=models.DecimalField(max_digits=3, decimal_places=2))
+
+
+def discount_price_expression(discountPercentage):
+    """
+    Database expression for the discounted price at a given percentage.
+    Mirrors utils.calculate_discount_price: ROUND() to 2 places, half up.
+
+    Args:
+        discountPercentage (Decimal): Discount percentage (0-100)
+
+    Returns:
+        Expression: Usable in update() and annotate()
+    """
+    discountPercentage = Decimal(str(discountPercentage))
+    if discountPercentage <= 0:
+        return F('originalprice')
+    factor = Value(discountPercentage / 100, output_field=models.DecimalField(max_digits=9, decimal_places=6))
+    return ExpressionWrapper(
+        Round(F('originalprice') - F('originalprice') * factor, 2),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def list_price_expression():
+    """
+    Database expression for each product's own discounted price, i.e. what
+    Product.save would store from its discountPercentage.
+    """
+    return Case(
+        When(
+            discountPercentage__gt=0,
+            # Multiplying by 0.01 instead of dividing by 100 avoids integer
+            # division on SQLite, which stores whole-number decimals as INTEGER
+            then=Round(F('originalprice') - F('originalprice') * F('discountPercentage') * PERCENT, 2),
+        ),
+        default=F('originalprice'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def preview_repricing(queryset, discountPercentage):
+    """
+    Dry run of reprice_products: the affected rows with their current and
+    new prices. New prices come from the same database expression the
+    UPDATE would use; nothing is written.
+
+    Yields:
+        dict: id, slug, productname, discountPrice, new_price and delta
+        (new_price - discountPrice)
+    """
+    rows = (
+        queryset.annotate(new_price=discount_price_expression(discountPercentage))
+        .values('id', 'slug', 'productname', 'discountPrice', 'new_price')
+        .order_by('id')
+    )
+    for row in rows.iterator():
+        # SQLite hands back computed decimals unquantized
+        row['new_price'] = Decimal(row['new_price']).quantize(CENT)
+        row['delta'] = row['new_price'] - (row['discountPrice'] or row['new_price'])
+        yield row
+
+
+def reprice_products(queryset, discountPercentage):
+    """
+    Sets the discount percentage of every product in `queryset` and
+    recomputes discountPrice in a single UPDATE statement.
+
+    Returns:
+        int: Number of products updated
+    """
+    with transaction.atomic():
+        updated = queryset.update(
+            discountPercentage=Decimal(str(discountPercentage)),
+            discountPrice=discount_price_expression(discountPercentage),
+        )
+        # The selection filters never look at the discount fields, so the
+        # queryset still matches the same products here
+        refresh_cart_totals(queryset.values('pk'))
+    # update() does not send post_save, so invalidate the catalog here
+    if updated:
+        bump_catalog_version()
+    return updated
+
+
+def refresh_cart_totals(products):
+    """
+    Recomputes Cart.item_count and Cart.total for every cart holding one of
+    `products`, in one UPDATE. Call it after writing prices with update().
+
+    Args:
+        products: Product ids, or a queryset of products or their ids
+    """
+    from .models import Cart
+
+    return Cart.objects.containing(products).refresh_totals()
+
+
+def apply_discount_schedules(now=None):
+    """
+    Runs one scheduler tick over DiscountSchedule windows.
+
+    Products whose last window closed go back to their list price, windows
+    that opened become active, and every product with an active window is
+    set to its best active discount. Each step is one bulk UPDATE (one per
+    distinct percentage for the last step) and rows that already hold the
+    right price are left alone, so a tick with no boundary writes nothing.
+    This also restores campaign prices after a product is edited in the
+    admin.
+
+    Returns:
+        int: Number of product prices changed
+    """
+    from .models import DiscountSchedule, Product
+
+    now = now or timezone.now()
+    schedules = DiscountSchedule.objects
+    in_window = schedules.filter(
+        status__in=[DiscountSchedule.STATUS_SCHEDULED, DiscountSchedule.STATUS_ACTIVE],
+        starts_at__lte=now,
+        ends_at__gt=now,
+    )
+    ended = schedules.filter(
+        status__in=[DiscountSchedule.STATUS_SCHEDULED, DiscountSchedule.STATUS_ACTIVE],
+        ends_at__lte=now,
+    )
+    # Ids of the repriced products, for refreshing cart totals; the
+    # schedule filters stop matching them as statuses move on
+    repriced = []
+    with transaction.atomic():
+        closed = list(Product.objects.filter(
+            pk__in=ended.filter(status=DiscountSchedule.STATUS_ACTIVE).values('product_id')
+        ).exclude(pk__in=in_window.values('product_id')).values_list('pk', flat=True))
+        Product.objects.filter(pk__in=closed).update(discountPrice=list_price_expression())
+        repriced += closed
+        ended.update(status=DiscountSchedule.STATUS_FINISHED)
+        in_window.filter(status=DiscountSchedule.STATUS_SCHEDULED).update(status=DiscountSchedule.STATUS_ACTIVE)
+
+        active = schedules.filter(status=DiscountSchedule.STATUS_ACTIVE)
+        best = active.values('product_id').annotate(best=Max('discountPercentage'))
+        for discountPercentage in active.values_list('discountPercentage', flat=True).distinct():
+            price = discount_price_expression(discountPercentage)
+            opened = list(Product.objects.filter(
+                pk__in=best.filter(best=discountPercentage).values('product_id')
+            ).exclude(discountPrice=price).values_list('pk', flat=True))
+            Product.objects.filter(pk__in=opened).update(discountPrice=price)
+            repriced += opened
+
+        if repriced:
+            refresh_cart_totals(repriced)
+
+    changed = len(repriced)
+    if changed:
+        bump_catalog_version()
+    return changed
@@ -0,0 +1,153 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_ids):
+        super().__init__(f"Not enough stock for Products {product_ids}")
+        self.product_ids = product_ids
+
+
+def hold_stock(cart_id, quantities):
+    """
+    Makes a cart's reservations match its quantities and restarts their
+    STOCK_RESERVATION_TTL. Only the difference to what the cart already
+    holds touches Product.reserved.
+
+    Args:
+        cart_id (UUID): The cart
+        quantities (dict): Mapping of product id to the cart's quantity;
+            0 releases the product
+
+    Raises:
+        OutOfStock: When a product cannot cover the extra quantity. Nothing
+        is changed then.
+    """
+    with transaction.atomic():
+        for attempt in range(2):
+            held = dict(
+                StockReservation.objects.select_for_update()
+                .filter(cart_id=cart_id, product_id__in=quantities)
+                .values_list('product_id', 'quantity')
+            )
+            grow = {pk: quantity - held.get(pk, 0) for pk, quantity in quantities.items() if quantity > held.get(pk, 0)}
+            shrink = {pk: held[pk] - quantity for pk, quantity in quantities.items() if quantity < held.get(pk, 0)}
+            if not grow or _reserve(grow):
+                break
+            if attempt:
+                raise OutOfStock(_short_products(grow))
+            # Expired holds still count until released; free the ones on
+            # these products (this cart's included) and look again
+            release_expired_reservations(product_ids=list(grow))
+        Product.objects.unreserve(shrink)
+
+        released = [pk for pk, quantity in quantities.items() if quantity <= 0]
+        if released:
+            StockReservation.objects.filter(cart_id=cart_id, product_id__in=released).delete()
+        expires_at = timezone.now() + settings.STOCK_RESERVATION_TTL
+        kept = [
+            StockReservation(cart_id=cart_id, product_id=pk, quantity=quantity, expires_at=expires_at)
+            for pk, quantity in quantities.items()
+            if quantity > 0
+        ]
+        if kept:
+            StockReservation.objects.bulk_create(
+                kept,
+                update_conflicts=True,
+                unique_fields=['cart_id', 'product'],
+                update_fields=['quantity', 'expires_at'],
+            )
+
+
+def _reserve(quantities):
+    # A partial update (some products short) is rolled back to the savepoint
+    savepoint = transaction.savepoint()
+    if Product.objects.reserve(quantities) != len(quantities):
+        transaction.savepoint_rollback(savepoint)
+        return False
+    transaction.savepoint_commit(savepoint)
+    return True
+
+
+def _short_products(quantities):
+    return sorted(
+        pk for pk, stock, reserved in Product.objects.filter(pk__in=quantities).values_list('pk', 'stock', 'reserved')
+        if stock - reserved < quantities[pk]
+    ) or sorted(quantities)
+
+
+def take_reservations(cart_id):
+    """
+    Removes a cart's reservations at checkout without touching the
+    counters; ProductQuerySet.decrement_stock() moves them out of
+    Product.reserved together with the stock.
+
+    Returns:
+        dict: Mapping of product id to the quantity the cart held
+    """
+    with transaction.atomic():
+        rows = list(
+            StockReservation.objects.select_for_update()
+            .filter(cart_id=cart_id)
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return {product_id: quantity for _, product_id, quantity in rows}
+
+
+def release_cart(cart_id):
+    """Gives back everything a cart holds."""
+    held = take_reservations(cart_id)
+    Product.objects.unreserve(held)
+    return held
+
+
+def release_carts(cart_ids):
+    """
+    Gives back everything several carts hold, e.g. carts being purged.
+
+    Returns:
+        int: Number of reservations released
+    """
+    with transaction.atomic():
+        rows = list(
+            StockReservation.objects.select_for_update()
+            .filter(cart_id__in=cart_ids)
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        totals = Counter()
+        for _, product_id, quantity in rows:
+            totals[product_id] += quantity
+        Product.objects.unreserve(totals)
+    return len(rows)
+
+
+def release_expired_reservations(batch_size=500, product_ids=None, now=None):
+    """
+    Deletes up to `batch_size` expired reservations and takes their
+    quantities off Product.reserved, in one transaction.
+
+    Returns:
+        int: Number of reservations released
+    """
+    with transaction.atomic():
+        expired = StockReservation.objects.filter(expires_at__lt=now or timezone.now()).order_by('expires_at')
+        if product_ids is not None:
+            expired = expired.filter(product_id__in=product_ids)
+        if connection.features.has_select_for_update_skip_locked:
+            expired = expired.select_for_update(skip_locked=True)
+        rows = list(expired.values_list('pk', 'product_id', 'quantity')[:batch_size])
+        if not rows:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        totals = Counter()
+        for _, product_id, quantity in rows:
+            totals[product_id] += quantity
+        Product.objects.unreserve(totals)
+    return len(rows)
@@ -0,0 +1,177 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from rest_framework.filters import BaseFilterBackend
+
+# Fields in the index, with their relevance weights
+SEARCH_FIELDS = (('productname', 10.0, 'A'), ('packtitle', 5.0, 'B'), ('description', 1.0, 'C'))
+
+FTS_TABLE = 'products_product_fts'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_INDEX = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        productname, packtitle, description,
+        content='products_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    # External content table: the triggers keep it in step with every
+    # write, including bulk_create() and update()
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, productname, packtitle, description)
+        VALUES (new.id, new.productname, new.packtitle, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, productname, packtitle, description)
+        VALUES ('delete', old.id, old.productname, old.packtitle, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_product_fts_update
+    AFTER UPDATE OF productname, packtitle, description ON products_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, productname, packtitle, description)
+        VALUES ('delete', old.id, old.productname, old.packtitle, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, productname, packtitle, description)
+        VALUES (new.id, new.productname, new.packtitle, new.description);
+    END
+    """,
+]
+
+SQLITE_TRIGGERS = ('products_product_fts_insert', 'products_product_fts_delete', 'products_product_fts_update')
+
+POSTGRES_VECTOR = " || ".join(
+    f"setweight(to_tsvector('english', coalesce({field}, '')), '{weight}')"
+    for field, _, weight in SEARCH_FIELDS
+)
+
+POSTGRES_INDEX = [
+    f"""
+    ALTER TABLE products_product ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS ({POSTGRES_VECTOR}) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS product_search_vector_idx ON products_product USING GIN (search_vector)",
+]
+
+
+def install_search_index(db_connection):
+    """
+    Creates the full-text index for the connection's database: an FTS5
+    table plus triggers on SQLite, a generated tsvector column with a GIN
+    index on PostgreSQL. Other databases fall back to icontains.
+
+    Safe to run repeatedly. On SQLite the index is rebuilt when its
+    triggers were missing, which happens whenever a migration remakes the
+    product table.
+    """
+    with db_connection.cursor() as cursor:
+        if db_connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+                SQLITE_TRIGGERS,
+            )
+            complete = len(cursor.fetchall()) == len(SQLITE_TRIGGERS)
+            for statement in SQLITE_INDEX:
+                cursor.execute(statement)
+            if not complete:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif db_connection.vendor == 'postgresql':
+            for statement in POSTGRES_INDEX:
+                cursor.execute(statement)
+
+
+def remove_search_index(db_connection):
+    with db_connection.cursor() as cursor:
+        if db_connection.vendor == 'sqlite':
+            for trigger in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif db_connection.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS product_search_vector_idx")
+            cursor.execute("ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector")
+
+
+def search_product_ids(query, limit=None):
+    """
+    Full-text search over product name, pack title and description.
+
+    Every word must match, the last one as a prefix so results appear while
+    typing. Name matches rank above pack title matches, which rank above
+    description matches.
+
+    Args:
+        query (str): Free text entered by the user
+        limit (int): Maximum number of ids, PRODUCT_SEARCH_MAX_RESULTS by default
+
+    Returns:
+        list: Product ids, most relevant first
+    """
+    from .models import Product
+
+    words = WORD_RE.findall(query.lower())
+    if not words:
+        return []
+    limit = limit or getattr(settings, 'PRODUCT_SEARCH_MAX_RESULTS', 500)
+
+    if connection.vendor == 'sqlite':
+        # Quoted so user input is never parsed as FTS5 syntax
+        match = ' '.join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+        weights = ', '.join(str(weight) for _, weight, _ in SEARCH_FIELDS)
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s"
+        )
+        params = [match.strip(), limit]
+    elif connection.vendor == 'postgresql':
+        tsquery = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+        sql = (
+            "SELECT id FROM products_product, to_tsquery('english', %s) query "
+            "WHERE search_vector @@ query ORDER BY ts_rank_cd(search_vector, query) DESC, id LIMIT %s"
+        )
+        params = [tsquery, limit]
+    else:
+        condition = Q()
+        for word in words:
+            condition &= Q(productname__icontains=word) | Q(packtitle__icontains=word) | Q(description__icontains=word)
+        return list(Product.objects.filter(condition).order_by('id').values_list('id', flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    Restricts the product list to full-text matches for `?q=` and orders
+    them by relevance.
+    """
+    search_param = 'q'
+
+    def get_search_query(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_search_query(request)
+        if not query:
+            return queryset
+        ids = search_product_ids(query)
+        if not ids:
+            return queryset.none()
+        rank = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+        return queryset.filter(pk__in=ids).order_by(rank)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': "Full-text search in name, pack title and description, ranked by relevance",
+            'schema': {'type': 'string'},
+        }]
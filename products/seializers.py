@@ -1,7 +1,16 @@
 from dataclasses import fields
+from decimal import Decimal
 from rest_framework import serializers
-from .models import Cart, CartItems, Order, OrderItem, Product
+from rest_framework.exceptions import NotFound
+from .carts import (
+    MAX_QUANTITY, OPERATION_ADD, OPERATION_REMOVE, OPERATION_SET,
+    CartContents, CartLine, QuantityTooLarge, get_cart_storage,
+)
+from .models import Order, OrderItem, OrderTransition, Product
+from .reservations import OutOfStock, take_reservations
 from django.db import transaction
+from django.db.models import Q
+from .cache import bump_catalog_version
 
 class ProductSerializer(serializers.ModelSerializer):
     discountAmount = serializers.DecimalField(
@@ -9,6 +18,7 @@ class ProductSerializer(serializers.ModelSerializer):
         decimal_places=2, 
         read_only=True
     )
+    productimage_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
@@ -23,71 +33,169 @@ class ProductSerializer(serializers.ModelSerializer):
             'discountPercentage', 
             'discountPrice', 
             'discountAmount',
-            'stock'
+            'stock',
+            'productimage_variants',
         ]
         read_only_fields = ['slug', 'discountPrice', 'discountAmount'] 
+    
+    def get_productimage_variants(self, product: Product):
+        """
+        URLs of the resized copies, e.g. {"card": {"webp": ..., "jpeg": ...}}.
+        Empty until the variants for the current image have been built.
+        """
+        variants = product.image_variants
+        if not product.productimage or variants.get('source') != product.productimage.name:
+            return {}
+        storage = product.productimage.storage
+        request = self.context.get('request')
+        urls = {}
+        for size, names in variants.items():
+            if size == 'source':
+                continue
+            urls[size] = {}
+            for extension, name in names.items():
+                url = storage.url(name)
+                urls[size][extension] = request.build_absolute_uri(url) if request else url
+        return urls
+class RepriceProductsSerializer(serializers.Serializer):
+    """
+    Selects products for a discount campaign. Every filter is optional;
+    with none given the whole catalog is repriced.
+    """
+    discountPercentage = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=Decimal('0'), max_value=Decimal('100')
+    )
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    search = serializers.CharField(required=False, help_text="Matches product or pack names")
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    dry_run = serializers.BooleanField(default=False)
+    
+    def get_queryset(self):
+        data = self.validated_data
+        queryset = Product.objects.all()
+        if 'ids' in data:
+            queryset = queryset.filter(pk__in=data['ids'])
+        if data.get('search'):
+            queryset = queryset.filter(
+                Q(productname__icontains=data['search']) | Q(packtitle__icontains=data['search'])
+            )
+        if 'min_price' in data:
+            queryset = queryset.filter(originalprice__gte=data['min_price'])
+        if 'max_price' in data:
+            queryset = queryset.filter(originalprice__lte=data['max_price'])
+        return queryset
+    
 class SimpleProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'productname','discountPrice']
         
-class CartItemSerializer(serializers.ModelSerializer):
-    product = SimpleProductSerializer(many=False)
+class CartItemSerializer(serializers.Serializer):
+    # Reads CartLine objects from the cart storage (see products.carts)
+    id = serializers.IntegerField(read_only=True)
+    cart = serializers.UUIDField(read_only=True)
+    product = SimpleProductSerializer(many=False, read_only=True)
+    quantity = serializers.IntegerField(read_only=True)
     sub_total = serializers.SerializerMethodField(
         method_name="subTotal",
     )
-    class Meta:
-        model = CartItems
-        fields  = ["id", "cart","product","quantity","sub_total"]
     
-    def subTotal(self,cartItem:CartItems):
+    def subTotal(self,cartItem:CartLine):
        return cartItem.quantity * cartItem.product.discountPrice 
         
     
-class AddCartItemSerializer(serializers.ModelSerializer):
+class AddCartItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
     product_id = serializers.IntegerField()
-    def validate_product_id(self, value):
-        if not Product.objects.filter(pk=value).exists():
-            raise serializers.ValidationError("The Product does not exist")
-        return value
+    quantity = serializers.IntegerField(min_value=0, max_value=MAX_QUANTITY)
         
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
         try:
-            cartItems =  CartItems.objects.get(product_id=product_id,cart_id=cart_id)
-            cartItems.quantity += quantity
-            cartItems.save()
-            
-            self.instance = cartItems
-        except:
-            self.instance = CartItems.objects.create(cart_id=cart_id,**self.validated_data)
+            self.instance = get_cart_storage().add(cart_id, product_id, quantity)
+        except (QuantityTooLarge, OutOfStock) as exc:
+            raise serializers.ValidationError({"quantity": str(exc)})
+        if self.instance is None:
+            raise serializers.ValidationError("The Cart or Product does not exist")
         return self.instance
-    
-    class Meta:
-        model = CartItems
-        fields = ['id', 'product_id', 'quantity']
          
          
-class UpdateCartItemSerializer(serializers.ModelSerializer):
-    # id = serializers.IntegerField(read_only=True)
-    class Meta:
-        model = CartItems
-        fields = ['quantity']
+class UpdateCartItemSerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=0, max_value=MAX_QUANTITY)
+    
+    def update(self, instance, validated_data):
+        try:
+            line = get_cart_storage().set_quantity(instance.cart, instance.id, validated_data['quantity'])
+        except OutOfStock as exc:
+            raise serializers.ValidationError({"quantity": str(exc)})
+        if line is None:
+            raise NotFound()
+        return line
+                        
+class CartItemOperationSerializer(serializers.Serializer):
+    OPERATION_ADD = OPERATION_ADD
+    OPERATION_SET = OPERATION_SET
+    OPERATION_REMOVE = OPERATION_REMOVE
+    
+    OPERATION_CHOICES = [OPERATION_ADD, OPERATION_SET, OPERATION_REMOVE]
+    MAX_QUANTITY = MAX_QUANTITY
+    
+    op = serializers.ChoiceField(choices=OPERATION_CHOICES)
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, max_value=MAX_QUANTITY, required=False)
+    
+    def validate(self, data):
+        if data['op'] != self.OPERATION_REMOVE and 'quantity' not in data:
+            raise serializers.ValidationError({"quantity": "This field is required."})
+        return data
+
+
+class BatchCartItemSerializer(serializers.Serializer):
+    """
+    Applies a list of add/set/remove operations to one cart.
+    Operations run in order against the current quantities and the result
+    is stored in one step (one DELETE and one bulk upsert with the ORM
+    storage).
+    """
+    operations = CartItemOperationSerializer(many=True, allow_empty=False)
+    
+    def validate_operations(self, operations):
+        product_ids = {operation['product_id'] for operation in operations}
+        found = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        missing = sorted(product_ids - found)
+        if missing:
+            raise serializers.ValidationError(f"The Products {missing} do not exist")
+        return operations
+    
+    def save(self, **kwargs):
+        try:
+            quantities = get_cart_storage().apply(self.context['cart_id'], self.validated_data['operations'])
+        except (QuantityTooLarge, OutOfStock) as exc:
+            raise serializers.ValidationError({"operations": str(exc)})
+        if quantities is None:
+            raise NotFound()
+        return quantities
                         
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(serializers.Serializer):
+    # Reads CartContents objects from the cart storage
     id = serializers.UUIDField(read_only=True)
     items = CartItemSerializer(many=True,read_only=True)
     cart_total = serializers.SerializerMethodField(
         method_name="get_cart_total",
     )
-    class Meta:
-        model =Cart
-        fields = ['id','items',"cart_total"]
     
-    def get_cart_total(self, cart: Cart):
-        return sum(item.quantity * item.product.discountPrice for item in cart.items.select_related('product'))
+    def get_cart_total(self, cart: CartContents):
+        # Maintained by the storage, see CartQuerySet.touch()
+        return cart.total
+    
+class CartSummarySerializer(serializers.Serializer):
+    # Mini-cart badges and headers; reads CartSummary objects
+    id = serializers.UUIDField(read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
             
 
         
@@ -96,16 +204,23 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = [
-            "id","product","quantity"
+            "id","product","quantity","unit_price"
         ]
         
+class OrderTransitionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderTransition
+        fields = ["from_status", "to_status", "note", "created_at"]
+        
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True,read_only=True)
+    transitions = OrderTransitionSerializer(many=True, read_only=True)
     class Meta:
         model = Order
         fields = [
-            "id","placed_at","pending_status","owner","items"
+            "id","placed_at","pending_status","owner","items","transitions"
         ]
+        read_only_fields = ["pending_status", "owner"]
         
 class CreateOrderSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
@@ -114,11 +229,57 @@ class CreateOrderSerializer(serializers.Serializer):
         with transaction.atomic():
             cart_id = self.validated_data["cart_id"]
             user_id = self.context['user_id']
+            
+            # Wherever the cart is stored, it only becomes rows here
+            storage = get_cart_storage()
+            quantities = {}
+            for line in storage.get_lines(cart_id) or ():
+                if line.quantity > 0:
+                    quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+            if not quantities:
+                raise serializers.ValidationError({"cart_id": "The cart is empty or does not exist"})
+            
+            # Units the cart reserved are its own to buy; they leave
+            # Product.reserved together with the stock
+            held = take_reservations(cart_id)
+            Product.objects.unreserve({pk: quantity for pk, quantity in held.items() if pk not in quantities})
+            held = {pk: quantity for pk, quantity in held.items() if pk in quantities}
+            
+            # Lock the rows in id order so concurrent checkouts cannot deadlock,
+            # then fail fast before anything is written
+            products = Product.objects.select_for_update().order_by('id').in_bulk(quantities)
+            # Carts kept outside the database can outlive their products
+            gone = sorted(quantities.keys() - products.keys())
+            if gone:
+                raise serializers.ValidationError({"cart_id": f"The Products {gone} are no longer available"})
+            out_of_stock = [
+                products[product_id].productname
+                for product_id, quantity in quantities.items()
+                if products[product_id].available + held.get(product_id, 0) < quantity
+            ]
+            if out_of_stock:
+                raise serializers.ValidationError(
+                    {"cart_id": [f"Not enough stock for {name}" for name in out_of_stock]}
+                )
+            
+            # The conditional UPDATE is the real guard on databases without
+            # row locks (SQLite), where select_for_update() is a no-op
+            if Product.objects.decrement_stock(quantities, held) != len(quantities):
+                raise serializers.ValidationError({"cart_id": "Some products went out of stock, please retry"})
+            
+            # Pending until `manage.py process_orders` has run it through
+            # the downstream steps, see products.orders
             order = Order.objects.create(owner_id=user_id)
-            cartItems = CartItems.objects.filter(cart_id=cart_id)
+            OrderTransition.objects.create(order=order, to_status=order.pending_status)
             orderitems = [OrderItem(order=order,
-                    product=item.product,
-                    quantity=item.quantity)
-            for item in cartItems]
+                    product_id=product_id,
+                    quantity=quantity,
+                    unit_price=products[product_id].discountPrice)
+            for product_id, quantity in quantities.items()]
             OrderItem.objects.bulk_create(orderitems)
-            Cart.objects.filter(id=cart_id).delete()
+            storage.delete(cart_id)
+            # Cached catalog pages only change when a product leaves the
+            # ?in_stock= results
+            if Product.objects.filter(pk__in=quantities, stock=0).exists():
+                transaction.on_commit(bump_catalog_version)
+        return order
@@ -0,0 +1,85 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from .autocomplete import FIELDS, autocomplete_index, bump_autocomplete_version
+from .cache import bump_catalog_version
+from .images import schedule_variants
+from .storage import release_blobs, retain_blobs, variant_names
+from .models import Cart, Product
+from .pricing import refresh_cart_totals
+from .search import FTS_TABLE, install_search_index
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def build_image_variants(sender, instance, **kwargs):
+    # Only when the image changed since the variants were built
+    if instance.productimage and instance.image_variants.get('source') != instance.productimage.name:
+        transaction.on_commit(lambda: schedule_variants(instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def track_image_references(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_productimage', None)
+    current = instance.productimage.name
+    if loaded != current:
+        retain_blobs([current])
+        release_blobs([loaded])
+        instance._loaded_productimage = current
+
+
+@receiver(post_delete, sender=Product)
+def release_image_references(sender, instance, **kwargs):
+    release_blobs([instance.productimage.name, *variant_names(instance.image_variants)])
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    # SQLite drops the FTS triggers whenever a migration remakes the
+    # product table; put them back and reindex
+    connection = connections[using]
+    if sender.name == 'products' and connection.vendor == 'sqlite':
+        if FTS_TABLE in connection.introspection.table_names():
+            install_search_index(connection)
+
+
+@receiver(post_save, sender=Product)
+def index_for_autocomplete(sender, instance, created, **kwargs):
+    # Stock, price and image changes leave the index alone
+    if not created and not instance.has_changed('slug', *FIELDS):
+        return
+    product = {'id': instance.pk, 'slug': instance.slug, **{field: getattr(instance, field) for field in FIELDS}}
+    transaction.on_commit(lambda: autocomplete_index.update(product, bump_autocomplete_version()))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_for_autocomplete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove(pk, bump_autocomplete_version()))
+
+
+@receiver(post_save, sender=Product)
+def refresh_cart_prices(sender, instance, created, **kwargs):
+    # save() recomputes discountPrice, which the stored cart totals use;
+    # stock and image updates leave it alone
+    if not created and instance.has_changed('discountPrice'):
+        refresh_cart_totals([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def remember_carts(sender, instance, **kwargs):
+    # The cascade removes the cart items, so find their carts first
+    instance._cart_ids = list(Cart.objects.containing([instance.pk]).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_cart_totals_after_delete(sender, instance, **kwargs):
+    cart_ids = getattr(instance, '_cart_ids', None)
+    if cart_ids:
+        Cart.objects.filter(pk__in=cart_ids).refresh_totals()
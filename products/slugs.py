@@ -0,0 +1,101 @@
+import base64
+import hashlib
+import hmac
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+FEISTEL_ROUNDS = 4
+HALF_BITS = 32
+HALF_MASK = (1 << HALF_BITS) - 1
+
+
+def get_slug_key():
+    # PRODUCT_SLUG_SECRET_KEY is None when the variable is not set
+    return (getattr(settings, 'PRODUCT_SLUG_SECRET_KEY', None) or settings.SECRET_KEY).encode()
+
+
+def permute(number, key):
+    """
+    Keyed Feistel permutation of the 64-bit integers.
+
+    Every input maps to a distinct output, so distinct counters can never
+    produce the same slug, while consecutive counters look unrelated
+    without the key.
+    """
+    left, right = number >> HALF_BITS, number & HALF_MASK
+    for round_number in range(FEISTEL_ROUNDS):
+        digest = hmac.new(key, f'{round_number}:{right}'.encode(), hashlib.sha256).digest()
+        left, right = right, left ^ int.from_bytes(digest[:4], 'big')
+    return (left << HALF_BITS) | right
+
+
+def slug_for(number, key=None):
+    """
+    Returns the slug for a sequence number: 11 URL-safe characters.
+
+    Older slugs (22 characters) can never collide with these.
+    """
+    value = permute(number, key or get_slug_key())
+    return base64.urlsafe_b64encode(value.to_bytes(8, 'big')).decode().rstrip('=')
+
+
+class SlugAllocator:
+    """
+    Hands out product slugs from blocks of sequence numbers reserved in
+    the SlugSequence table (hi/lo allocation).
+
+    Only reserving a block touches the database, one UPDATE per
+    PRODUCT_SLUG_BLOCK_SIZE slugs, and processes always get disjoint
+    blocks, so no slug needs an existence check. Numbers left in a block
+    when the process exits are simply skipped.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.next = self.end = 0
+
+    def reserve(self, size):
+        """
+        Reserves `size` sequence numbers.
+
+        Returns:
+            range: The reserved numbers
+        """
+        from .models import SlugSequence
+
+        with transaction.atomic():
+            SlugSequence.objects.get_or_create(name=self.name)
+            SlugSequence.objects.filter(name=self.name).update(next_value=F('next_value') + size)
+            end = SlugSequence.objects.values_list('next_value', flat=True).get(name=self.name)
+        return range(end - size, end)
+
+    def release(self, block):
+        with self.lock:
+            if self.next >= self.end:
+                self.next, self.end = block.start, block.stop
+
+    def allocate(self, count=1):
+        """
+        Returns `count` new slugs, reserving a new block only when the
+        current one runs out.
+        """
+        with self.lock:
+            numbers = list(range(self.next, min(self.next + count, self.end)))
+            self.next += len(numbers)
+        missing = count - len(numbers)
+        if missing:
+            block = self.reserve(max(missing, getattr(settings, 'PRODUCT_SLUG_BLOCK_SIZE', 100)))
+            numbers += block[:missing]
+            # Inside a transaction the reservation only counts once it
+            # commits; after a rollback another process may get the same
+            # block, so the rest of it must not be used then
+            transaction.on_commit(lambda: self.release(block[missing:]))
+        key = get_slug_key()
+        return [slug_for(number, key) for number in numbers]
+
+
+product_slugs = SlugAllocator('product')
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.db.models import F
+from django.utils import timezone
+
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.[\w]+)?$')
+
+
+def is_content_addressed(name):
+    """
+    True for names produced by ContentAddressedStorage. Their content can
+    never change, so they can be served with immutable cache headers.
+    """
+    return bool(name and CONTENT_ADDRESSED_NAME.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names files after the SHA-256 of their content.
+
+    `combopack280.jpeg` is stored as `3f/3f9a...c2.jpeg`; uploading the same
+    bytes again returns the existing name instead of writing another copy.
+    Every stored file gets a StoredBlob row whose reference count is kept
+    by the Product signals, so unused files can be garbage-collected with
+    `manage.py gc_media_blobs`.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if not self.exists(name):
+            name = super().save(name, content, max_length=max_length)
+        register_blob(name)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # A content-addressed name that is taken holds the same bytes, so
+        # it is reused rather than given a random suffix
+        if is_content_addressed(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not is_content_addressed(name):
+            return super()._save(name, content)
+        # Written under a temporary name and linked into place: readers
+        # never see a partial file, and losing a race with a concurrent
+        # save of the same content is a dedup hit
+        temporary = super()._save(posixpath.join(posixpath.dirname(name), f'.{uuid.uuid4().hex}.tmp'), content)
+        try:
+            os.link(self.path(temporary), self.path(name))
+        except FileExistsError:
+            pass
+        finally:
+            self.delete(temporary)
+        return name
+
+
+def get_product_image_storage():
+    return storages['product_images']
+
+
+def register_blob(name):
+    """
+    Records a stored file with no references yet, or marks an existing
+    record as recently used so garbage collection leaves it alone for the
+    grace period.
+    """
+    from .models import StoredBlob
+
+    if not is_content_addressed(name):
+        return
+    StoredBlob.objects.bulk_create([StoredBlob(name=name)], ignore_conflicts=True)
+    StoredBlob.objects.filter(name=name).update(updated_at=timezone.now())
+
+
+def retain_blobs(names):
+    """Adds one reference to every content-addressed name in `names`."""
+    from .models import StoredBlob
+
+    names = {name for name in names if is_content_addressed(name)}
+    if not names:
+        return
+    StoredBlob.objects.bulk_create([StoredBlob(name=name) for name in names], ignore_conflicts=True)
+    StoredBlob.objects.filter(name__in=names).update(refcount=F('refcount') + 1)
+
+
+def release_blobs(names):
+    """Drops one reference from every content-addressed name in `names`."""
+    from .models import StoredBlob
+
+    names = {name for name in names if is_content_addressed(name)}
+    if names:
+        StoredBlob.objects.filter(name__in=names, refcount__gt=0).update(refcount=F('refcount') - 1)
+
+
+def variant_names(image_variants):
+    """Storage names listed in a Product.image_variants mapping."""
+    return [
+        name
+        for size, names in (image_variants or {}).items()
+        if size != 'source'
+        for name in names.values()
+    ]
@@ -1,3 +1,695 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from products.autocomplete import autocomplete_index
+from products.cache import get_catalog_version
+from products.carts import MAX_QUANTITY, QuantityTooLarge
+from products.models import Cart, CartItems, DiscountSchedule, Order, OrderItem, Product, SlugSequence, StockReservation, StoredBlob
+from products.orders import (
+    BaseOrderHandler, OrderRejected, claim_orders, complete_order, process_pending_orders, renew_leases,
+)
+from products.pricing import apply_discount_schedules, reprice_products
+from products.reservations import release_expired_reservations
+from products.search import search_product_ids
+from products.seializers import CreateOrderSerializer
+from products.slugs import SlugAllocator, permute
+from products.storage import get_product_image_storage
+from users.models import User
+
+
+class ProductTestMixin:
+    """
+    Runs a test class against a throwaway MEDIA_ROOT, removed afterwards,
+    with image variants built inline.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root, PRODUCT_IMAGE_VARIANTS_ASYNC=False)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def create_product(self, productname="Combo Pack", **fields):
+        fields = {'productimage': "combopack280.jpeg", 'packtitle': "280g", 'originalprice': 100, **fields}
+        return Product.objects.create(productname=productname, **fields)
+
+
+class ConcurrentCheckoutTest(ProductTestMixin, TransactionTestCase):
+    """
+    Many customers check out the last few units at the same time.
+    Runs against whatever database is configured (SQLite locally, Postgres
+    in production settings).
+    """
+    stock = 5
+    customers = 20
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="buyer@example.com", first_name="Test", last_name="Buyer", password="secret123"
+        )
+        self.product = self.create_product(discountPercentage=10, stock=self.stock)
+        self.carts = []
+        for _ in range(self.customers):
+            cart = Cart.objects.create()
+            CartItems.objects.create(cart=cart, product=self.product, quantity=1)
+            self.carts.append(cart)
+
+    def checkout(self, cart, barrier, results):
+        barrier.wait()
+        try:
+            for attempt in range(100):
+                try:
+                    serializer = CreateOrderSerializer(data={"cart_id": str(cart.id)}, context={"user_id": self.user.id})
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                    results.append("ok")
+                    return
+                except OperationalError:
+                    # SQLite locks the whole table against concurrent writers;
+                    # the transaction was rolled back, so try again
+                    time.sleep(0.01 * (attempt % 10 + 1))
+            results.append("gave up")
+        except ValidationError:
+            results.append("rejected")
+        finally:
+            connection.close()
+
+    def test_concurrent_checkout_never_oversells(self):
+        barrier = threading.Barrier(self.customers)
+        results = []
+        threads = [
+            threading.Thread(target=self.checkout, args=(cart, barrier, results))
+            for cart in self.carts
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(results.count("ok"), self.stock)
+        self.assertEqual(results.count("rejected"), self.customers - self.stock)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(OrderItem.objects.count(), self.stock)
+
+    def test_decrement_ignores_stale_reads(self):
+        # Both checkouts read the product while one unit was left
+        first = Product.objects.get(pk=self.product.pk)
+        second = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+
+        self.assertEqual(Product.objects.decrement_stock({first.pk: 1}), 1)
+        self.assertEqual(Product.objects.decrement_stock({second.pk: 1}), 0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_checkout_snapshots_unit_price(self):
+        serializer = CreateOrderSerializer(data={"cart_id": str(self.carts[0].id)}, context={"user_id": self.user.id})
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+
+        self.product.originalprice = 200
+        self.product.save()
+        item = order.items.get()
+        self.assertEqual(item.unit_price, 90)
+        self.assertFalse(Cart.objects.filter(pk=self.carts[0].id).exists())
+
+    def checkout_cart(self, cart):
+        serializer = CreateOrderSerializer(data={"cart_id": str(cart.id)}, context={"user_id": self.user.id})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    def test_checkout_keeps_catalog_cache_until_sold_out(self):
+        url = f'/api/products/{self.product.slug}/'
+        self.assertEqual(APIClient().get(url).data['stock'], self.stock)
+
+        version = get_catalog_version()
+        self.checkout_cart(self.carts[0])
+        self.assertEqual(get_catalog_version(), version)
+        # The cached page carries the live stock
+        self.assertEqual(APIClient().get(url).data['stock'], self.stock - 1)
+
+        CartItems.objects.filter(cart=self.carts[1]).update(quantity=self.stock - 1)
+        self.checkout_cart(self.carts[1])
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_checkout_fails_fast_when_out_of_stock(self):
+        CartItems.objects.filter(cart=self.carts[0]).update(quantity=self.stock + 1)
+        serializer = CreateOrderSerializer(data={"cart_id": str(self.carts[0].id)}, context={"user_id": self.user.id})
+        serializer.is_valid(raise_exception=True)
+
+        with self.assertRaises(ValidationError):
+            serializer.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, self.stock)
+        self.assertFalse(Order.objects.exists())
+
+
+class ProductSearchTest(ProductTestMixin, TestCase):
+    def create(self, productname, packtitle, description):
+        return self.create_product(productname, packtitle=packtitle, description=description)
+
+    def test_matches_are_ranked_by_field(self):
+        in_description = self.create("Shampoo", "200ml", "With rose extract")
+        in_name = self.create("Rose face wash", "100ml", "Gentle cleanser")
+        in_packtitle = self.create("Aloe gel", "Rose pack", "Soothing")
+        self.create("Conditioner", "200ml", "Argan oil")
+
+        self.assertEqual(search_product_ids("rose"), [in_name.pk, in_packtitle.pk, in_description.pk])
+        # The last word matches as a prefix
+        self.assertEqual(search_product_ids("face wa"), [in_name.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        product = self.create("Conditioner", "200ml", "Argan oil")
+        Product.objects.filter(pk=product.pk).update(description="Rose oil")
+        self.assertEqual(search_product_ids("rose"), [product.pk])
+        product.delete()
+        self.assertEqual(search_product_ids("rose"), [])
+
+    def test_list_endpoint_searches_with_q(self):
+        self.create("Rose face wash", "100ml", "Gentle cleanser")
+        self.create("Aloe gel", "Rose pack", "Soothing")
+
+        response = APIClient().get('/api/products/', {'q': 'rose', 'page_size': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([p['productname'] for p in response.data['results']], ["Rose face wash"])
+
+
+class CatalogCacheTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.product = self.create_product()
+        self.client = APIClient()
+
+    def test_responses_are_cached_until_a_product_changes(self):
+        for url in ['/api/products/', f'/api/products/{self.product.slug}/']:
+            self.client.get(url)
+            # Only the live stock is read
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.product.productname = "Family Pack"
+        self.product.save()
+        self.assertEqual(self.client.get('/api/products/').data['results'][0]['productname'], "Family Pack")
+        self.assertEqual(self.client.get(f'/api/products/{self.product.slug}/').data['productname'], "Family Pack")
+
+        self.product.delete()
+        self.assertEqual(self.client.get('/api/products/').data['results'], [])
+
+    def test_query_strings_are_cached_separately(self):
+        self.create_product("Gift Box", originalprice=500)
+        self.assertEqual(len(self.client.get('/api/products/').data['results']), 2)
+        self.assertEqual(len(self.client.get('/api/products/', {'page_size': 1}).data['results']), 1)
+
+
+class DiscountScheduleTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.product = self.create_product(originalprice=200)
+        self.now = timezone.now()
+
+    def schedule(self, discountPercentage, starts_in, ends_in):
+        return DiscountSchedule.objects.create(
+            product=self.product,
+            discountPercentage=discountPercentage,
+            starts_at=self.now + timedelta(hours=starts_in),
+            ends_at=self.now + timedelta(hours=ends_in),
+        )
+
+    def price(self):
+        return Product.objects.get(pk=self.product.pk).discountPrice
+
+    def test_best_open_window_sets_the_price(self):
+        small = self.schedule(10, -1, 1)
+        best = self.schedule(30, -1, 3)
+        later = self.schedule(50, 5, 6)
+
+        self.assertEqual(apply_discount_schedules(self.now), 1)
+        self.assertEqual(self.price(), 140)
+        # Nothing crossed a boundary since
+        self.assertEqual(apply_discount_schedules(self.now), 0)
+
+        self.assertEqual(apply_discount_schedules(self.now + timedelta(hours=2)), 0)
+        self.assertEqual(apply_discount_schedules(self.now + timedelta(hours=4)), 1)
+        self.assertEqual(self.price(), 200)
+        self.assertEqual(
+            [schedule.status for schedule in DiscountSchedule.objects.filter(pk__in=[small.pk, best.pk, later.pk]).order_by('pk')],
+            [DiscountSchedule.STATUS_FINISHED, DiscountSchedule.STATUS_FINISHED, DiscountSchedule.STATUS_SCHEDULED],
+        )
+
+    def test_campaign_price_survives_admin_edits(self):
+        self.schedule(25, -1, 1)
+        apply_discount_schedules(self.now)
+        product = Product.objects.get(pk=self.product.pk)
+        product.packtitle = "300g"
+        product.save()
+        self.assertEqual(self.price(), 200)
+
+        self.assertEqual(apply_discount_schedules(self.now), 1)
+        self.assertEqual(self.price(), 150)
+
+
+class ProductFilterTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.plain = self.create_product("Shampoo", stock=5)
+        self.on_sale = self.create_product("Face Wash", originalprice=200, discountPercentage=50)
+        self.pricey = self.create_product("Gift Box", originalprice=500, stock=2)
+
+
+    def ids(self, **params):
+        response = APIClient().get('/api/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']]
+
+    def test_price_range(self):
+        self.assertEqual(self.ids(min_price=100, max_price=150), [self.plain.id, self.on_sale.id])
+        self.assertEqual(self.ids(min_price=101), [self.pricey.id])
+        self.assertEqual(self.ids(min_discount=10), [self.on_sale.id])
+
+    def test_on_sale(self):
+        self.assertEqual(self.ids(on_sale='true'), [self.on_sale.id])
+        self.assertEqual(self.ids(on_sale='false'), [self.plain.id, self.pricey.id])
+
+    def test_in_stock(self):
+        self.assertEqual(self.ids(in_stock='true'), [self.plain.id, self.pricey.id])
+        self.assertEqual(self.ids(in_stock='false', page_size=1), [self.on_sale.id])
+
+
+class AutocompleteTest(ProductTestMixin, TestCase):
+    def create(self, productname, packtitle):
+        return self.create_product(productname, packtitle=packtitle)
+
+    def names(self, query):
+        return [product['productname'] for product in autocomplete_index.search(query)]
+
+    def test_suggestions_come_from_memory(self):
+        self.create("Rose Face Wash", "100ml")
+        self.create("Face Cream", "Rose pack")
+        autocomplete_index.build()
+
+        with self.assertNumQueries(0):
+            response = APIClient().get('/api/products/autocomplete/', {'q': 'fac'})
+        self.assertEqual([p['productname'] for p in response.data], ["Face Cream", "Rose Face Wash"])
+        # Name matches before pack title matches
+        self.assertEqual(self.names("rose"), ["Rose Face Wash", "Face Cream"])
+        self.assertEqual(self.names("face w"), ["Rose Face Wash"])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = self.create("Rose Face Wash", "100ml")
+        autocomplete_index.build()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            added = self.create("Facial Kit", "Single")
+            product.productname = "Lily Wash"
+            product.save()
+        self.assertEqual(self.names("fac"), ["Facial Kit"])
+        self.assertEqual(self.names("lily"), ["Lily Wash"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            added.delete()
+        self.assertEqual(self.names("fac"), [])
+
+    def test_short_prefixes_rank_every_match(self):
+        for i in range(5):
+            self.create(f"Pack {i}", "Roast blend")
+        autocomplete_index.build()
+
+        # Pack title keys sort first, but the name match still wins
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create("Rose Face Wash", "100ml")
+        self.assertEqual(self.names("ro")[0], "Rose Face Wash")
+        self.assertEqual(len(self.names("ro")), 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create("Rob Soap", "1pc")
+        self.assertEqual(self.names("ro")[:2], ["Rob Soap", "Rose Face Wash"])
+
+    @override_settings(AUTOCOMPLETE_REFRESH_INTERVAL=0)
+    def test_local_changes_do_not_trigger_rebuilds(self):
+        product = self.create("Rose Face Wash", "100ml")
+        autocomplete_index.build()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create("Facial Kit", "Single")
+            product.stock = 3
+            product.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names("fac"), ["Facial Kit", "Rose Face Wash"])
+
+
+class ImportProductsTest(ProductTestMixin, TestCase):
+    def write(self, suffix, text):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_csv_is_imported_in_batches(self):
+        path = self.write('.csv', (
+            "productname,productimage,packtitle,originalprice,discountPercentage,stock\n"
+            "Rose Wash,rose.jpeg,100ml,200,25,4\n"
+            "Aloe Gel,aloe.jpeg,50ml,80,,\n"
+            "Gift Box,box.jpeg,1pc,500,10,1\n"
+        ))
+        version = get_catalog_version()
+        out = StringIO()
+        call_command('import_products', path, '--batch-size', '2', stdout=out)
+
+        self.assertIn("Imported 2 products\nImported 3 products", out.getvalue())
+        rose = Product.objects.get(productname="Rose Wash")
+        self.assertEqual((rose.discountPrice, rose.stock), (150, 4))
+        self.assertEqual(Product.objects.get(productname="Aloe Gel").discountPrice, 80)
+        self.assertEqual(len(set(Product.objects.values_list('slug', flat=True))), 3)
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_batches_before_an_invalid_row_are_kept(self):
+        path = self.write('.jsonl', "\n".join([
+            '{"productname": "Rose Wash", "productimage": "rose.jpeg", "packtitle": "100ml", "originalprice": 200}',
+            '{"productname": "Aloe Gel", "productimage": "aloe.jpeg", "packtitle": "50ml", "originalprice": 80}',
+            '{"productname": "Gift Box", "productimage": "box.jpeg", "packtitle": "1pc", "originalprice": "free"}',
+        ]))
+        with self.assertRaisesMessage(CommandError, "Line 3: invalid price"):
+            call_command('import_products', path, '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(sorted(Product.objects.values_list('productname', flat=True)), ["Aloe Gel", "Rose Wash"])
+
+
+class SlugAllocatorTest(TestCase):
+    def test_permutation_is_collision_free(self):
+        outputs = {permute(number, b'key') for number in range(10000)}
+        self.assertEqual(len(outputs), 10000)
+
+    @override_settings(PRODUCT_SLUG_BLOCK_SIZE=10)
+    def test_slugs_are_reserved_in_blocks(self):
+        allocator = SlugAllocator('test')
+        with self.captureOnCommitCallbacks(execute=True):
+            first = allocator.allocate(3)
+        # The rest of the block is served from memory
+        with self.assertNumQueries(0):
+            second = allocator.allocate(7)
+        third = allocator.allocate(25)
+
+        slugs = first + second + third
+        self.assertEqual(len(set(slugs)), 35)
+        self.assertEqual(SlugSequence.objects.get(name='test').next_value, 35)
+
+
+class MediaBlobGCTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.storage = get_product_image_storage()
+
+    def store(self, content):
+        return self.storage.save('combopack280.jpeg', ContentFile(content))
+
+    def age(self, hours):
+        StoredBlob.objects.update(updated_at=timezone.now() - timedelta(hours=hours))
+
+    def gc(self):
+        call_command('gc_media_blobs', stdout=StringIO())
+
+    def test_referenced_blobs_are_kept(self):
+        used = self.store(b'used')
+        unused = self.store(b'unused')
+        self.create_product(productimage=used)
+        self.age(48)
+
+        self.gc()
+        self.assertTrue(self.storage.exists(used))
+        self.assertFalse(self.storage.exists(unused))
+        self.assertEqual(list(StoredBlob.objects.values_list('name', 'refcount')), [(used, 1)])
+
+    def test_existing_content_is_not_written_twice(self):
+        name = self.store(b'same')
+        # As if a concurrent save had written it after the exists() check
+        self.assertEqual(self.storage.get_available_name(name), name)
+        self.assertEqual(self.storage._save(name, ContentFile(b'same')), name)
+        self.assertEqual(self.storage.listdir(os.path.dirname(name))[1], [os.path.basename(name)])
+
+    def test_unreferenced_blobs_wait_for_the_grace_period(self):
+        name = self.store(b'unused')
+        self.age(23)
+        self.gc()
+        self.assertTrue(self.storage.exists(name))
+
+        self.age(25)
+        self.gc()
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredBlob.objects.exists())
+
+
+CACHE_CARTS = {
+    'CART_STORAGE': 'products.carts.CacheCartStorage',
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'carts'}},
+}
+
+
+class CartStorageTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="buyer@example.com", first_name="Test", last_name="Buyer", password="secret123"
+        )
+        self.products = [self.create_product(f"Pack {i}", discountPercentage=10, stock=10) for i in range(2)]
+        self.client = APIClient()
+
+    def shop(self):
+        first, second = self.products
+        cart_id = self.client.post('/api/carts/').data['id']
+        items = f'/api/carts/{cart_id}/items/'
+        item = self.client.post(items, {'product_id': first.id, 'quantity': 2}).data
+        self.client.post(items, {'product_id': first.id, 'quantity': 1})
+        self.client.patch(f"{items}{item['id']}/", {'quantity': 4})
+        self.client.post(f'{items}batch/', {'operations': [
+            {'op': 'add', 'product_id': second.id, 'quantity': 1},
+        ]}, format='json')
+
+        cart = self.client.get(f'/api/carts/{cart_id}/').data
+        self.assertEqual([line['quantity'] for line in cart['items']], [4, 1])
+        self.assertEqual(cart['cart_total'], 5 * first.discountPrice)
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/', {'cart_id': cart_id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(f'/api/carts/{cart_id}/').status_code, 404)
+        self.assertEqual(Product.objects.get(pk=first.pk).stock, 6)
+
+    def test_database_carts(self):
+        self.shop()
+
+    def test_totals_follow_items_and_prices(self):
+        first, second = self.products
+        cart_id = self.client.post('/api/carts/').data['id']
+        self.client.post(f'/api/carts/{cart_id}/items/batch/', {'operations': [
+            {'op': 'add', 'product_id': first.id, 'quantity': 2},
+            {'op': 'add', 'product_id': second.id, 'quantity': 1},
+        ]}, format='json')
+        with self.assertNumQueries(1):
+            summary = self.client.get(f'/api/carts/{cart_id}/summary/').data
+        self.assertEqual((summary['item_count'], summary['total']), (3, '270.00'))
+
+        reprice_products(Product.objects.filter(pk=first.pk), 50)
+        second.originalprice = 200
+        second.save()
+        summary = self.client.get(f'/api/carts/{cart_id}/summary/').data
+        self.assertEqual((summary['item_count'], summary['total']), (3, '280.00'))
+
+        # Stock updates leave the carts alone
+        product = Product.objects.get(pk=second.pk)
+        product.stock = 20
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        self.assertFalse([query for query in queries if Cart._meta.db_table in query['sql']])
+
+        first.delete()
+        self.assertEqual(self.client.get(f'/api/carts/{cart_id}/').data['cart_total'], 180)
+
+    @override_settings(**CACHE_CARTS)
+    def test_cache_carts_stay_out_of_the_database(self):
+        self.shop()
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItems.objects.exists())
+
+    def test_upsert_stops_at_the_largest_quantity(self):
+        cart = Cart.objects.create()
+        product = self.products[0]
+        CartItems.objects.create(cart=cart, product=product, quantity=MAX_QUANTITY - 1)
+
+        with self.assertRaises(QuantityTooLarge):
+            CartItems.objects.add_quantity(cart.id, product.id, 2)
+        self.assertEqual(CartItems.objects.get().quantity, MAX_QUANTITY - 1)
+        self.assertEqual(CartItems.objects.add_quantity(cart.id, product.id, 1).quantity, MAX_QUANTITY)
+        self.assertIsNone(CartItems.objects.add_quantity(cart.id, product.id + 100, 1))
+
+
+class StockReservationTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.product = self.create_product("Flash Pack", stock=3)
+        self.client = APIClient()
+
+    def add(self, quantity):
+        cart_id = self.client.post('/api/carts/').data['id']
+        response = self.client.post(f'/api/carts/{cart_id}/items/', {'product_id': self.product.id, 'quantity': quantity})
+        return cart_id, response
+
+    def availability(self):
+        return self.client.get(f'/api/products/{self.product.slug}/availability/').data
+
+    def test_carts_cannot_hold_more_than_the_stock(self):
+        first, _ = self.add(2)
+        _, response = self.add(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.availability()['available'], 1)
+
+        # Saving the product keeps the counter
+        Product.objects.get(pk=self.product.pk).save()
+        self.assertEqual(Product.objects.get(pk=self.product.pk).reserved, 2)
+
+        self.client.force_authenticate(User.objects.create_user(
+            email="buyer@example.com", first_name="Test", last_name="Buyer", password="secret123"
+        ))
+        self.assertEqual(self.client.post('/api/orders/', {'cart_id': first}).status_code, 201)
+        self.assertEqual(self.availability(), {'id': self.product.id, 'stock': 1, 'reserved': 0, 'available': 1})
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_are_released(self):
+        with override_settings(STOCK_RESERVATION_TTL=timedelta(0)):
+            self.add(3)
+        self.assertEqual(self.availability()['available'], 0)
+        call_command('release_reservations', '--once', stdout=StringIO())
+        self.assertEqual(self.availability()['available'], 3)
+
+        # A cart short of stock frees expired holds itself
+        with override_settings(STOCK_RESERVATION_TTL=timedelta(0)):
+            self.add(3)
+        _, response = self.add(1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.availability()['reserved'], 1)
+        self.assertEqual(release_expired_reservations(now=timezone.now() + timedelta(days=1)), 1)
+        self.assertEqual(self.availability()['available'], 3)
+
+    def test_purged_carts_release_their_stock(self):
+        carts = [self.add(1)[0] for _ in range(3)]
+        idle = timezone.now() - settings.CART_TTL - timedelta(minutes=1)
+        Cart.objects.filter(pk__in=carts[:2]).update(updated_at=idle)
+
+        # One cart per batch: the last batch comes back empty
+        out = StringIO()
+        call_command('purge_carts', '--batch-size', '1', '--sleep', '0', stdout=out)
+        self.assertIn("Deleted 2 carts and 2 items, released 2 reservations", out.getvalue())
+        self.assertEqual([str(pk) for pk in Cart.objects.values_list('pk', flat=True)], carts[2:])
+        self.assertEqual(self.availability(), {'id': self.product.id, 'stock': 3, 'reserved': 1, 'available': 2})
+        self.assertEqual([str(pk) for pk in StockReservation.objects.values_list('cart_id', flat=True)], carts[2:])
+
+
+class OrderHistoryTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.product = self.create_product()
+        self.buyer = User.objects.create_user(email="buyer@example.com", first_name="Test", last_name="Buyer", password="secret123")
+        self.other = User.objects.create_user(email="other@example.com", first_name="Other", last_name="Buyer", password="secret123")
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def place(self, owner, count):
+        orders = []
+        for _ in range(count):
+            order = Order.objects.create(owner=owner)
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, unit_price=100)
+            orders.append(order.id)
+        return orders
+
+    def test_history_is_newest_first_in_three_queries(self):
+        mine = self.place(self.buyer, 3)
+        self.place(self.other, 2)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/orders/', {'page_size': 2})
+        self.assertEqual([order['id'] for order in response.data['results']], mine[:0:-1])
+        self.assertEqual(response.data['results'][0]['items'][0]['product']['id'], self.product.id)
+
+        next_page = self.client.get(response.data['next']).data
+        self.assertEqual([order['id'] for order in next_page['results']], mine[:1])
+        self.assertIsNone(next_page['next'])
+
+    def test_other_owners_orders_are_hidden(self):
+        theirs = self.place(self.other, 1)[0]
+        self.assertEqual(self.client.get(f'/api/orders/{theirs}/').status_code, 404)
+
+
+class RejectingOrderHandler(BaseOrderHandler):
+    def process(self, order, idempotency_key):
+        raise OrderRejected("Card declined")
+
+
+class OrderProcessingTest(ProductTestMixin, TestCase):
+    def setUp(self):
+        self.product = self.create_product(stock=5)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(
+            email="buyer@example.com", first_name="Test", last_name="Buyer", password="secret123"
+        ))
+
+    def checkout(self):
+        cart_id = self.client.post('/api/carts/').data['id']
+        self.client.post(f'/api/carts/{cart_id}/items/', {'product_id': self.product.id, 'quantity': 2})
+        response = self.client.post('/api/orders/', {'cart_id': cart_id})
+        self.assertEqual(response.data['pending_status'], Order.PAYMENT_STATUS_PENDING)
+        return response.data['id']
+
+    def statuses(self, order_id):
+        return [
+            (transition['from_status'], transition['to_status'])
+            for transition in self.client.get(f'/api/orders/{order_id}/').data['transitions']
+        ]
+
+    def test_status_cannot_be_changed_through_the_api(self):
+        order_id = self.checkout()
+        self.assertEqual(self.client.patch(f'/api/orders/{order_id}/', {'pending_status': 'C'}).status_code, 405)
+        self.assertEqual(self.client.delete(f'/api/orders/{order_id}/').status_code, 405)
+        self.assertEqual(Order.objects.get(pk=order_id).pending_status, Order.PAYMENT_STATUS_PENDING)
+
+    def test_pending_orders_are_completed(self):
+        order_id = self.checkout()
+        call_command('process_orders', '--once', stdout=StringIO())
+        self.assertEqual(self.statuses(order_id), [('', 'P'), ('P', 'C')])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 3)
+
+    @override_settings(ORDER_PROCESSING_HANDLER='products.tests.RejectingOrderHandler')
+    def test_rejected_orders_fail_and_restock(self):
+        order_id = self.checkout()
+        self.assertEqual(process_pending_orders(), (0, 1, 0))
+        self.assertEqual(self.statuses(order_id), [('', 'P'), ('P', 'F')])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 5)
+        # Finished orders are not picked up again
+        self.assertEqual(process_pending_orders(), (0, 0, 0))
+
+    def test_results_need_the_lease(self):
+        order_id = self.checkout()
+        order, = claim_orders(10, timedelta(minutes=5))
+        self.assertTrue(renew_leases([order]))
+        # Another worker claims the order after the lease ran out
+        Order.objects.filter(pk=order_id).update(attempts=F('attempts') + 1)
+        self.assertFalse(renew_leases([order]))
+        self.assertFalse(complete_order(order))
+        self.assertEqual(self.statuses(order_id), [('', 'P')])
 
-# Create your tests here.
@@ -1,42 +1,179 @@
-from django.shortcuts import render
+import uuid
+from functools import partial
+from django.http import Http404
+from django.shortcuts import get_object_or_404, render
+from django.db.models import Prefetch
+from rest_framework import status
 from rest_framework.response import Response
-from products.models import Cart, CartItems, Order, Product
-from products.seializers import AddCartItemSerializer, CartItemSerializer, CartSerializer, CreateOrderSerializer, OrderSerializer, ProductSerializer, UpdateCartItemSerializer
+from products.filters import ProductFilter
+from products.models import Cart, CartItems, Order, OrderItem, OrderTransition, Product
+from products.seializers import AddCartItemSerializer, BatchCartItemSerializer, CartItemSerializer, CartSerializer, CartSummarySerializer, CreateOrderSerializer, OrderSerializer, ProductSerializer, RepriceProductsSerializer, UpdateCartItemSerializer
 from rest_framework.viewsets import ModelViewSet,GenericViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter,OrderingFilter
 from rest_framework.permissions import IsAuthenticated,IsAdminUser,AllowAny
 from rest_framework.decorators import action
-from rest_framework.mixins import CreateModelMixin,RetrieveModelMixin,DestroyModelMixin
+from rest_framework.mixins import CreateModelMixin,ListModelMixin,RetrieveModelMixin,DestroyModelMixin
+from products.autocomplete import autocomplete_index
+from products.carts import CartContents, get_cart_storage
+from products.cache import cached_catalog_response
+from products.pagination import OrderCursorPagination, ProductCursorPagination, ProductSearchPagination
+from products.pricing import preview_repricing, reprice_products
+from products.search import ProductSearchFilter
 # Create your views here.
 class ProductViewSet(ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    filter_backends = [ProductSearchFilter, DjangoFilterBackend]
+    filterset_class = ProductFilter
     lookup_field = 'slug'
     
+    @property
+    def paginator(self):
+        # Ranked search results have no key a cursor could be built on
+        request = getattr(self, 'request', None)
+        if request is not None and ProductSearchFilter().get_search_query(request):
+            self.pagination_class = ProductSearchPagination
+        return super().paginator
+    
     def get_permissions(self):
         """
-        - List and retrieve operations are open to all.
+        - List, retrieve, autocomplete and availability operations are open to all.
         - Create, update, patch and delete operations require admin privileges.
         """
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'autocomplete', 'availability']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAuthenticated, IsAdminUser]
         return [permission() for permission in permission_classes]
 
+    @action(detail=False, methods=['post'])
+    def reprice(self, request):
+        """
+        Applies a discount percentage to the selected products in one SQL
+        UPDATE. With "dry_run": true nothing is written and the affected
+        rows are returned with their price deltas.
+        """
+        serializer = RepriceProductsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queryset = serializer.get_queryset()
+        discountPercentage = serializer.validated_data['discountPercentage']
+        
+        if serializer.validated_data['dry_run']:
+            changes = list(preview_repricing(queryset, discountPercentage))
+            return Response({"affected": len(changes), "changes": changes})
+        
+        updated = reprice_products(queryset, discountPercentage)
+        return Response({"affected": updated})
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Search-as-you-type suggestions for ?q=, answered from the in-memory
+        prefix index (products/autocomplete.py) without a database query.
+        Returns at most ?limit= (default 10, max 50) products.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({"limit": "A valid integer is required."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(autocomplete_index.search(request.query_params.get('q', ''), limit))
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, slug=None):
+        """
+        Live stock of one product: units in stock, units held by carts and
+        what is left to add to a cart. Read from the counters on the product
+        row, never from the catalog cache.
+        """
+        product = get_object_or_404(Product.objects.only('id', 'slug', 'stock', 'reserved'), slug=slug)
+        return Response({
+            "id": product.id,
+            "stock": product.stock,
+            "reserved": product.reserved,
+            "available": product.available,
+        })
+
+    def list(self, request, *args, **kwargs):
+        # Served from the versioned catalog cache, see products/cache.py
+        return cached_catalog_response(
+            request, partial(super().list, request, *args, **kwargs), refresh=self.add_live_stock
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_catalog_response(
+            request, partial(super().retrieve, request, *args, **kwargs), refresh=self.add_live_stock
+        )
+
+    def add_live_stock(self, data):
+        """
+        Replaces the stock in a cached list or detail payload with the
+        current value, in one primary key lookup. Checkouts move the stock
+        without invalidating the catalog cache.
+        """
+        products = data.get('results', [data]) if isinstance(data, dict) else data
+        products = [product for product in products if 'id' in product]
+        stock = dict(Product.objects.filter(pk__in=[product['id'] for product in products]).values_list('pk', 'stock'))
+        for product in products:
+            product['stock'] = stock.get(product['id'], 0)
+
 
-class CartViewSet(CreateModelMixin,GenericViewSet,RetrieveModelMixin,DestroyModelMixin):
-    queryset = Cart.objects.all()
+class CartStorageMixin:
+    """Carts and their items live in the CART_STORAGE backend, not in querysets."""
+    
+    def get_storage(self):
+        return get_cart_storage()
+    
+    def get_cart_id(self, value):
+        try:
+            return uuid.UUID(str(value))
+        except ValueError:
+            raise Http404
+    
+    def get_cart(self, cart_id):
+        cart = self.get_storage().get_contents(self.get_cart_id(cart_id))
+        if cart is None:
+            raise Http404
+        return cart
+
+
+class CartViewSet(CartStorageMixin,GenericViewSet):
+    # Only describes the URLs for the API docs; carts are read from storage
+    queryset = Cart.objects.none()
     serializer_class = CartSerializer
     
+    def create(self, request, *args, **kwargs):
+        cart = CartContents(id=self.get_storage().create())
+        return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
+    
+    def retrieve(self, request, pk=None):
+        return Response(CartSerializer(self.get_cart(pk)).data)
+    
+    def destroy(self, request, pk=None):
+        if not self.get_storage().delete(self.get_cart_id(pk)):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=True, methods=['get'], serializer_class=CartSummarySerializer)
+    def summary(self, request, pk=None):
+        """
+        Item count and total of a cart without its items, for mini-cart
+        badges. One row read with the database cart storage.
+        """
+        summary = self.get_storage().get_summary(self.get_cart_id(pk))
+        if summary is None:
+            raise Http404
+        return Response(CartSummarySerializer(summary).data)
+    
     
     
-class CartItemsViewSet(ModelViewSet):
-    http_method_names = ['get', 'post', 'patch', 'delete']
-    def get_queryset(self): 
-        return CartItems.objects.filter(cart_id=self.kwargs["cart_pk"])
+class CartItemsViewSet(CartStorageMixin,GenericViewSet):
+    queryset = CartItems.objects.none()
+    
     def get_serializer_class(self):
+        if self.action == "batch":
+            return BatchCartItemSerializer
         if self.request.method == "POST":
             return AddCartItemSerializer
         elif self.request.method == "PATCH":
@@ -45,13 +182,63 @@ class CartItemsViewSet(ModelViewSet):
         return CartItemSerializer
     
     def get_serializer_context(self):
-        return {"cart_id":self.kwargs["cart_pk"]}
+        if getattr(self, 'swagger_fake_view', False):
+            return {}
+        return {"cart_id":self.get_cart_id(self.kwargs["cart_pk"])}
+    
+    def get_line(self, pk):
+        cart = self.get_cart(self.kwargs["cart_pk"])
+        for line in cart.items:
+            if str(line.id) == pk:
+                return line
+        raise Http404
+    
+    def list(self, request, cart_pk=None):
+        return Response(CartItemSerializer(self.get_cart(cart_pk).items, many=True).data)
+    
+    def retrieve(self, request, pk=None, cart_pk=None):
+        return Response(CartItemSerializer(self.get_line(pk)).data)
+    
+    def create(self, request, cart_pk=None):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    def partial_update(self, request, pk=None, cart_pk=None):
+        serializer = self.get_serializer(self.get_line(pk), data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+    
+    def destroy(self, request, pk=None, cart_pk=None):
+        line = self.get_line(pk)
+        self.get_storage().remove(line.cart, line.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request, cart_pk=None):
+        """
+        Applies several add/set/remove operations in one request, e.g.
+        {"operations": [{"op": "add", "product_id": 1, "quantity": 2},
+                        {"op": "remove", "product_id": 4}]}
+        and returns the updated cart.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(CartSerializer(self.get_cart(cart_pk)).data)
     
     
     
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(CreateModelMixin,ListModelMixin,RetrieveModelMixin,GenericViewSet):
+    # No update or delete: status only moves through products.orders, which
+    # records each transition and restocks failed orders
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['pending_status']
     
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -60,10 +247,23 @@ class OrderViewSet(ModelViewSet):
         
     def get_queryset(self):
         user = self.request.user
+        # Orders, their items with products, and status history in three
+        # queries per page
+        queryset = Order.objects.prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('product')),
+            Prefetch('transitions', queryset=OrderTransition.objects.order_by('created_at', 'id')),
+        )
         if user.is_staff:
-            return Order.objects.all()
+            return queryset
         
-        return Order.objects.filter(owner=user)
+        return queryset.filter(owner_id=user.id)
+    
+    def create(self, request, *args, **kwargs):
+        serializer = CreateOrderSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+        serializer = OrderSerializer(order)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     def get_serializer_context(self):
         return {"user_id":self.request.user.id}
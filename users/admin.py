@@ -1,6 +1,19 @@
 from django.contrib import admin
 
-from .models import User
+from .models import EmailOutbox, User
+
+
+class EmailOutboxAdmin(admin.ModelAdmin):
+    # The body is left out: pending messages may hold live password-reset links
+    list_display = ('subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    exclude = ('body',)
+    readonly_fields = ('subject', 'from_email', 'recipients', 'attempts', 'created_at', 'sent_at', 'last_error')
+
+    def has_add_permission(self, request):
+        return False
+
 
 # Register your models here.
-admin.site.register(User)
\ No newline at end of file
+admin.site.register(User)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .revocation import is_revoked
+
+# Claims User.token() adds on top of the user id
+PROFILE_CLAIMS = ('email', 'first_name', 'last_name', 'is_staff', 'is_superuser')
+# What get_cached_user() keeps: the profile, without the password hash
+CACHED_USER_FIELDS = (
+    'id', 'email', 'first_name', 'last_name', 'phone_number', 'date_of_birth',
+    'is_active', 'is_staff', 'is_superuser', 'date_joined',
+)
+
+
+class ClaimsUser(TokenUser):
+    """
+    A user built only from the claims of a verified access token.
+
+    Carries the id, email, names and staff flags, which is all the API
+    views need for permission checks and ownership filters. Use
+    `get_full_user()` when the complete row is required.
+    """
+
+    def get_full_user(self):
+        return get_cached_user(self.id)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the profile claims in the token instead
+    of loading the User row on every request.
+
+    Claims are fixed for the token's lifetime: a user who is deactivated or
+    loses staff rights keeps them until the access token expires
+    (SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']), unless the token itself is
+    revoked. Tokens issued before the claims existed still fall back to the
+    database lookup.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        # Answered by the in-memory Bloom filter for tokens never revoked
+        if is_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+        return validated_token
+
+    def get_user(self, validated_token):
+        claims = (api_settings.USER_ID_CLAIM, *PROFILE_CLAIMS)
+        if all(claim in validated_token for claim in claims):
+            return ClaimsUser(validated_token)
+        return super().get_user(validated_token)
+
+
+def user_cache_key(user_id):
+    return f'users:user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """
+    Returns the user's profile fields, cached for USER_CACHE_TIMEOUT
+    seconds. The entry is dropped whenever the user is saved or deleted.
+
+    Only CACHED_USER_FIELDS are cached, never the password hash; other
+    fields of the returned User are deferred and load on first access.
+
+    Returns:
+        User: The user, or None if it no longer exists
+    """
+    key = user_cache_key(user_id)
+    values = cache.get(key)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values(*CACHED_USER_FIELDS).first()
+        if values is None:
+            return None
+        cache.set(key, values, getattr(settings, 'USER_CACHE_TIMEOUT', 60))
+    # from_db() takes the values in model field order
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(User.objects.db, fields, [values[name] for name in fields])
+
+
+def forget_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.outbox import prune_outbox
+
+
+class Command(BaseCommand):
+    help = "Deletes sent and failed outbox messages older than EMAIL_OUTBOX_RETENTION_DAYS. Run it from cron."
+
+    def handle(self, *args, **options):
+        deleted = prune_outbox()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} outbox messages"))
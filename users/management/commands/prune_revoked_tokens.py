@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.revocation import prune_revoked_tokens
+
+
+class Command(BaseCommand):
+    help = "Deletes revoked tokens that have expired, so the revocation store only holds live tokens. Run it from cron."
+
+    def handle(self, *args, **options):
+        deleted = prune_revoked_tokens()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} expired revocations"))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers messages from the email outbox in batches over one backend "
+        "connection, retrying failures with backoff. Runs in a loop every "
+        "--interval seconds; use --once from cron instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between polls (default: 5)")
+        parser.add_argument('--batch-size', type=int, help="Messages per connection (default: EMAIL_OUTBOX_BATCH_SIZE)")
+        parser.add_argument('--once', action='store_true', help="Send what is due and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            sent, failed = send_queued_emails(options['batch_size'])
+            if sent or failed or options['verbosity'] > 1:
+                self.stdout.write(f"Sent {sent} emails, {failed} failed")
+            if options['once']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
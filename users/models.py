@@ -1,8 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser,PermissionsMixin
 from django.utils.translation import gettext_lazy as _
-from rest_framework_simplejwt.tokens import RefreshToken
 from .managers import UserManager
+from .tokens import RevocableRefreshToken
 
 class User(AbstractBaseUser,PermissionsMixin):
     first_name = models.CharField(max_length=100,verbose_name=_("First Name"))
@@ -29,9 +29,75 @@ class User(AbstractBaseUser,PermissionsMixin):
         return f"{self.first_name} {self.last_name}"
     
     def token(self):
-       refresh = RefreshToken.for_user(self)
+       refresh = RevocableRefreshToken.for_user(self)
+       self.set_profile_claims(refresh)
        return {
            'refresh': str(refresh),
            'access': str(refresh.access_token)
        }
-    
\ No newline at end of file
+    
+    def set_profile_claims(self, refresh):
+       # Copied into every access token; StatelessJWTAuthentication builds
+       # request.user from them without querying the database. Reset from
+       # the row on every refresh (users.serializer.TokenRefreshSerializer)
+       refresh['email'] = self.email
+       refresh['first_name'] = self.first_name
+       refresh['last_name'] = self.last_name
+       refresh['is_staff'] = self.is_staff
+       refresh['is_superuser'] = self.is_superuser
+    
+
+class EmailOutbox(models.Model):
+    """
+    An email waiting to be delivered by the send_queued_email worker.
+
+    Request handlers only insert a row (see users.outbox.queue_email), so
+    they never wait on the SMTP server or fail because it is down.
+    """
+    STATUS_PENDING = 'P'
+    STATUS_SENT = 'S'
+    STATUS_FAILED = 'F'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(auto_now_add=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
+
+
+class RevokedToken(models.Model):
+    """
+    A JWT (refresh or access) that must no longer be accepted, keyed by its
+    `jti` claim. Rows are only needed until the token would have expired
+    anyway; `manage.py prune_revoked_tokens` deletes them after that.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at'], name='revoked_expires_at_idx'),
+            models.Index(fields=['revoked_at'], name='revoked_revoked_at_idx'),
+        ]
+
+    def __str__(self):
+        return self.jti
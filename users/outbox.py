@@ -0,0 +1,171 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def queue_email(subject, message, recipient_list, from_email=None):
+    """
+    Stores an email in the outbox instead of sending it.
+
+    When EMAIL_OUTBOX_SEND_IN_PROCESS is enabled the outbox is flushed on a
+    background thread once the surrounding transaction commits; otherwise
+    it is left for `manage.py send_queued_email`.
+
+    Returns:
+        EmailOutbox: The queued message
+    """
+    email = EmailOutbox.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL or '',
+        recipients=list(recipient_list),
+    )
+    if getattr(settings, 'EMAIL_OUTBOX_SEND_IN_PROCESS', True):
+        transaction.on_commit(schedule_flush)
+    return email
+
+
+def get_executor():
+    # A single worker: one SMTP connection at a time is plenty, and it keeps
+    # concurrent flushes from the same process from racing for rows
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='email-outbox')
+        return _executor
+
+
+def _flush_in_worker():
+    try:
+        send_queued_emails()
+    except Exception:
+        logger.exception("Could not flush the email outbox")
+    finally:
+        connection.close()
+
+
+def schedule_flush():
+    return get_executor().submit(_flush_in_worker)
+
+
+def retry_delay(attempts):
+    """Exponential backoff: EMAIL_OUTBOX_RETRY_DELAY seconds, doubled per attempt."""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    return timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def claim_batch(batch_size, lease):
+    """
+    Reserves up to `batch_size` due messages for this worker by pushing
+    their next attempt `lease` into the future, so a parallel worker (or a
+    crashed one) does not send them twice before the lease runs out.
+    """
+    now = timezone.now()
+    due = EmailOutbox.objects.filter(status=EmailOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due.order_by('next_attempt_at', 'id')[:batch_size])
+        EmailOutbox.objects.filter(pk__in=[email.pk for email in batch]).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + lease,
+        )
+    for email in batch:
+        email.attempts += 1
+    return batch
+
+
+def send_queued_emails(batch_size=None):
+    """
+    Sends every due outbox message, `batch_size` at a time, reusing one
+    backend connection per batch. Failed messages are retried with
+    exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS is reached.
+
+    Returns:
+        tuple: (sent, failed) counts
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    lease = timedelta(minutes=5)
+    sent = failed = 0
+
+    while True:
+        batch = claim_batch(batch_size, lease)
+        if not batch:
+            return sent, failed
+
+        delivered, errors = [], []
+        backend = get_connection(fail_silently=False)
+        try:
+            backend.open()
+            for email in batch:
+                message = EmailMessage(
+                    subject=email.subject,
+                    body=email.body,
+                    from_email=email.from_email or None,
+                    to=email.recipients,
+                    connection=backend,
+                )
+                try:
+                    message.send()
+                except Exception as e:
+                    errors.append((email, e))
+                else:
+                    delivered.append(email.pk)
+        except Exception as e:
+            # Could not connect at all; everything not yet sent is retried
+            done = set(delivered) | {email.pk for email, _ in errors}
+            errors.extend((email, e) for email in batch if email.pk not in done)
+        finally:
+            try:
+                backend.close()
+            except Exception:
+                pass
+
+        now = timezone.now()
+        # Bodies can carry live links (password resets); they are not kept
+        # once the message is out of our hands
+        EmailOutbox.objects.filter(pk__in=delivered).update(
+            status=EmailOutbox.STATUS_SENT,
+            sent_at=now,
+            last_error='',
+            body='',
+        )
+        for email, error in errors:
+            logger.warning("Could not send email %s (attempt %s): %s", email.pk, email.attempts, error)
+            if email.attempts >= max_attempts:
+                changes = {'status': EmailOutbox.STATUS_FAILED, 'body': ''}
+            else:
+                changes = {'next_attempt_at': now + retry_delay(email.attempts)}
+            EmailOutbox.objects.filter(pk=email.pk).update(last_error=str(error), **changes)
+        sent += len(delivered)
+        failed += len(errors)
+
+
+def prune_outbox():
+    """
+    Deletes sent and given-up messages older than EMAIL_OUTBOX_RETENTION_DAYS.
+
+    Returns:
+        int: Number of rows deleted
+    """
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'EMAIL_OUTBOX_RETENTION_DAYS', 7))
+    deleted, _ = EmailOutbox.objects.filter(
+        status__in=[EmailOutbox.STATUS_SENT, EmailOutbox.STATUS_FAILED],
+        created_at__lte=cutoff,
+    ).delete()
+    return deleted
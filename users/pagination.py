@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the admin user listing.
+    The view's `ordering` (and `?ordering=`) is used as the cursor key.
+    """
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        # Names repeat; `id` in the same direction makes the order total, so
+        # users sharing a name are neither skipped nor repeated across pages
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering = (*ordering, '-id' if ordering[0].startswith('-') else 'id')
+        return ordering
@@ -0,0 +1,152 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+# Rows committed slightly out of order are still picked up by the next sync
+SYNC_LOOKBACK = timedelta(minutes=1)
+
+
+class BloomFilter:
+    """
+    A fixed-size set membership test with no false negatives.
+
+    `key in bloom` is False for every key never added, and True for added
+    keys plus roughly `error_rate` of the others while no more than
+    `capacity` keys have been added.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        if all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions):
+            return
+        for p in positions:
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    @property
+    def saturated(self):
+        return self.count > self.capacity
+
+
+class RevocationIndex:
+    """
+    Per-process Bloom filter over the RevokedToken table.
+
+    New rows are pulled in at most every TOKEN_REVOCATION_SYNC_INTERVAL
+    seconds, so a token revoked by another process is rejected here after
+    that delay at the latest. Tokens revoked by this process are added
+    immediately.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.synced_at = 0.0
+        self.synced_until = None
+
+    def sync(self, force=False):
+        """Returns the filter, first pulling in new revocations if it is due."""
+        from .models import RevokedToken
+
+        interval = getattr(settings, 'TOKEN_REVOCATION_SYNC_INTERVAL', 5)
+        with self.lock:
+            if not force and self.bloom is not None and time.monotonic() - self.synced_at < interval:
+                return self.bloom
+            started = timezone.now()
+            if self.bloom is None or self.bloom.saturated:
+                rows = RevokedToken.objects.filter(expires_at__gt=started)
+                capacity = getattr(settings, 'TOKEN_REVOCATION_CAPACITY', 100_000)
+                bloom = BloomFilter(max(capacity, rows.count() * 2))
+            else:
+                rows = RevokedToken.objects.filter(revoked_at__gte=self.synced_until - SYNC_LOOKBACK)
+                bloom = self.bloom
+            for jti in rows.values_list('jti', flat=True).iterator():
+                bloom.add(jti)
+            self.bloom = bloom
+            self.synced_until = started
+            self.synced_at = time.monotonic()
+            return bloom
+
+    def might_contain(self, jti):
+        return jti in self.sync()
+
+    def add(self, jti):
+        bloom = self.sync()
+        with self.lock:
+            bloom.add(jti)
+
+    def reset(self):
+        with self.lock:
+            self.bloom = None
+
+
+revocation_index = RevocationIndex()
+
+
+def is_revoked(jti):
+    """
+    True if the token with this `jti` was revoked. Only tokens the Bloom
+    filter cannot rule out cost a query.
+    """
+    from .models import RevokedToken
+
+    if not jti or not revocation_index.might_contain(jti):
+        return False
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def revoke_token(token):
+    """
+    Revokes a validated simplejwt token until its expiry.
+
+    Returns:
+        bool: False if it was already revoked
+    """
+    from .models import RevokedToken
+
+    jti = token[api_settings.JTI_CLAIM]
+    _, created = RevokedToken.objects.get_or_create(
+        jti=jti,
+        defaults={'expires_at': datetime_from_epoch(token['exp'])},
+    )
+    revocation_index.add(jti)
+    return created
+
+
+def prune_revoked_tokens():
+    """
+    Deletes revocations of tokens that have expired anyway.
+
+    Returns:
+        int: Number of rows deleted
+    """
+    from .models import RevokedToken
+
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    # Drop the pruned keys from this process' filter on its next check
+    revocation_index.reset()
+    return deleted
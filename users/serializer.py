@@ -2,7 +2,11 @@ import datetime
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings
 from .models import User
+from .tokens import RevocableRefreshToken
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 
 class UserSerializer(serializers.ModelSerializer):
@@ -127,4 +131,34 @@ class PasswordResetSerializer(serializers.Serializer):
         user = User.objects.get(pk=uid)
         user.set_password(self.validated_data['password'])
         user.save()
-        return user
\ No newline at end of file
+        return user
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """
+    Rejects revoked refresh tokens and, with ROTATE_REFRESH_TOKENS, revokes
+    the one that was just exchanged.
+
+    The profile claims are reloaded from the User row on every refresh, so
+    lost staff rights or a deactivated account take effect within one
+    access token lifetime instead of riding along in the refresh token.
+    """
+    token_class = RevocableRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user = User.objects.filter(pk=refresh.payload.get(api_settings.USER_ID_CLAIM)).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        user.set_profile_claims(refresh)
+
+        data = {"access": str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data["refresh"] = str(refresh)
+        return data
@@ -1,12 +1,207 @@
-from django.test import TestCase
-
-# Create your tests here.
-from django.core.mail import send_mail
-
-send_mail(
-    'Test Email',
-    'This is a test email from Django.',
-    'itzmeakashps@gmail.com',
-    ['gorgiebackendtest@gmail.com'],  # Replace with a valid recipient
-    fail_silently=False,
-)
\ No newline at end of file
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPServerDisconnected
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .authentication import get_cached_user, user_cache_key
+from .models import EmailOutbox, RevokedToken, User
+from .outbox import prune_outbox, queue_email, send_queued_emails
+from .revocation import BloomFilter, prune_revoked_tokens, revocation_index
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPServerDisconnected("Connection unexpectedly closed")
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_OUTBOX_SEND_IN_PROCESS=False,
+    EMAIL_OUTBOX_MAX_ATTEMPTS=2,
+)
+class EmailOutboxTest(TestCase):
+    def test_password_reset_only_queues(self):
+        User.objects.create_user(email='reset@example.com', password='secret1', first_name='A', last_name='B')
+        response = APIClient().post('/api/users/password/reset/', {'email': 'reset@example.com'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = EmailOutbox.objects.get()
+        self.assertEqual(queued.recipients, ['reset@example.com'])
+
+        call_command('send_queued_email', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/reset-password/', mail.outbox[0].body)
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, EmailOutbox.STATUS_SENT)
+        self.assertEqual(queued.body, '')
+
+    def test_batches_are_sent_once(self):
+        for i in range(5):
+            queue_email('Hello', 'Body', [f'user{i}@example.com'])
+
+        self.assertEqual(send_queued_emails(batch_size=2), (5, 0))
+        self.assertEqual(send_queued_emails(), (0, 0))
+        self.assertEqual(len(mail.outbox), 5)
+
+    @override_settings(EMAIL_BACKEND='users.tests.FailingEmailBackend')
+    def test_failures_are_retried_then_given_up(self):
+        email = queue_email('Hello', 'Body', ['user@example.com'])
+
+        self.assertEqual(send_queued_emails(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.STATUS_PENDING, 1))
+        self.assertIn('unexpectedly closed', email.last_error)
+        # Backing off: not due again yet
+        self.assertEqual(send_queued_emails(), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        send_queued_emails()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.STATUS_FAILED, 2))
+
+    @override_settings(EMAIL_OUTBOX_RETENTION_DAYS=7)
+    def test_prune_keeps_pending_and_recent_messages(self):
+        old, recent, pending = (queue_email('Hello', 'Body', [f'user{i}@example.com']) for i in range(3))
+        send_queued_emails()
+        EmailOutbox.objects.filter(pk=pending.pk).update(status=EmailOutbox.STATUS_PENDING)
+        EmailOutbox.objects.filter(pk__in=[old.pk, pending.pk]).update(created_at=timezone.now() - timedelta(days=8))
+
+        self.assertEqual(prune_outbox(), 1)
+        self.assertQuerySetEqual(EmailOutbox.objects.order_by('pk'), [recent, pending])
+
+
+class StatelessJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='jwt@example.com', password='secret1', first_name='A', last_name='B')
+        self.client = APIClient()
+        # Keep the periodic revocation sync out of the query counts
+        revocation_index.sync(force=True)
+
+    def test_claims_replace_the_user_query(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user.token()['access']}")
+        # Only the (empty) orders page itself is queried
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_tokens_without_claims_fall_back_to_the_database(self):
+        access = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_uses_the_cached_row(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user.token()['access']}")
+        self.assertEqual(self.client.get('/api/users/profile/').data['email'], 'jwt@example.com')
+        with self.assertNumQueries(0):
+            self.client.get('/api/users/profile/')
+
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/profile/').data['first_name'], 'Changed')
+
+    def test_password_hash_is_not_cached(self):
+        self.assertEqual(get_cached_user(self.user.pk).email, 'jwt@example.com')
+        self.assertNotIn('password', cache.get(user_cache_key(self.user.pk)))
+
+
+class UserListPaginationTest(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='secret1', first_name='Zed', last_name='Admin')
+        self.users = [
+            User.objects.create_user(email=f'sam{i}@example.com', password='secret1', first_name='Sam', last_name='Lee')
+            for i in range(7)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def walk(self, ordering):
+        emails = []
+        url, params = '/api/users/', {'ordering': ordering, 'page_size': 3}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            emails += [user['email'] for user in response.data['results']]
+            url, params = response.data['next'], None
+        return emails
+
+    def test_equal_names_are_paged_by_id(self):
+        sams = [user.email for user in self.users]
+        self.assertEqual(self.walk('first_name'), [*sams, 'admin@example.com'])
+        self.assertEqual(self.walk('-first_name'), ['admin@example.com', *reversed(sams)])
+
+    def test_unique_orderings_are_kept(self):
+        emails = self.walk('-email')
+        self.assertEqual(emails, sorted(emails, reverse=True))
+        self.assertEqual(len(emails), 8)
+
+
+class TokenRevocationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='revoke@example.com', password='secret1', first_name='A', last_name='B')
+        self.tokens = self.user.token()
+        self.client = APIClient()
+
+    def test_logout_revokes_refresh_and_access_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        response = self.client.post('/api/users/logout/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, 401)
+        self.client.credentials()
+        response = self.client.post('/api/users/token/refresh/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_rotates_and_revokes_the_old_token(self):
+        response = self.client.post('/api/users/token/refresh/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+        reused = self.client.post('/api/users/token/refresh/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(reused.status_code, 401)
+        rotated = self.client.post('/api/users/token/refresh/', {'refresh': response.data['refresh']}, format='json')
+        self.assertEqual(rotated.status_code, 200)
+
+    def test_refresh_reloads_the_profile_claims(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post('/api/users/token/refresh/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertTrue(AccessToken(response.data['access'])['is_staff'])
+
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post('/api/users/token/refresh/', {'refresh': response.data['refresh']}, format='json')
+        self.assertFalse(AccessToken(response.data['access'])['is_staff'])
+        self.assertFalse(RefreshToken(response.data['refresh'])['is_staff'])
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post('/api/users/token/refresh/', {'refresh': response.data['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_prune_removes_expired_revocations(self):
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(minutes=1))
+        RevokedToken.objects.create(jti='live', expires_at=timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(prune_revoked_tokens(), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'added-{i}')
+
+        self.assertTrue(all(f'added-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
@@ -0,0 +1,26 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import is_revoked, revoke_token
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    Refresh token checked against the RevokedToken store instead of
+    simplejwt's token_blacklist app, which needs a row per issued token.
+    """
+
+    def verify(self, *args, **kwargs):
+        super().verify(*args, **kwargs)
+        if is_revoked(self.payload.get(api_settings.JTI_CLAIM)):
+            raise TokenError(_("Token is revoked"))
+
+    def blacklist(self):
+        # Called by TokenRefreshSerializer when BLACKLIST_AFTER_ROTATION is set
+        return revoke_token(self)
+
+    def outstand(self):
+        # Only revoked tokens are stored
+        return None
@@ -7,6 +7,7 @@ from .views import (
     UserUpdateView,
     LoginUserView,
     LogoutView,
+    RefreshTokenView,
     PasswordResetRequestView,
     PasswordResetConfirmView
 )
@@ -16,6 +17,7 @@ urlpatterns = [
     path('register/', UserRegisterView.as_view(), name='register'),
     path('login/', LoginUserView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('token/refresh/', RefreshTokenView.as_view(), name='token_refresh'),
     
     # User profile endpoints
     path('profile/', UserProfileView.as_view(), name='user_profile'),
@@ -4,15 +4,21 @@ from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from .authentication import get_cached_user
 from .models import User
-from .serializer import UserSerializer, UserUpdateSerializer
+from .pagination import UserCursorPagination
+from .revocation import revoke_token
+from .serializer import TokenRefreshSerializer, UserSerializer, UserUpdateSerializer
+from .tokens import RevocableRefreshToken
 from dateutil import parser as date_parser
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from .serializer import PasswordResetRequestSerializer, PasswordResetSerializer
-from django.core.mail import send_mail
+from .outbox import queue_email
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
@@ -138,6 +144,36 @@ class LoginUserView(APIView):
         return response
 
 
+class RefreshTokenView(TokenRefreshView):
+    """
+    API view exchanging a refresh token for a new access token (and a new
+    refresh token, which revokes the old one). No authentication required.
+    """
+    serializer_class = TokenRefreshSerializer
+
+    @swagger_auto_schema(
+        operation_description="Exchange a refresh token for new tokens. Revoked refresh tokens are rejected.",
+        request_body=TokenRefreshSerializer,
+        responses={
+            200: openapi.Response(
+                description="Success",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'access': openapi.Schema(type=openapi.TYPE_STRING),
+                        'refresh': openapi.Schema(type=openapi.TYPE_STRING),
+                    }
+                )
+            ),
+            401: "Unauthorized - Invalid, expired or revoked refresh token"
+        },
+        tags=['Authentication'],
+        operation_summary="Refresh tokens"
+    )
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
 class UserListView(generics.ListAPIView):
     """
     API view for admin to list all users. Admin authentication required.
@@ -149,6 +185,7 @@ class UserListView(generics.ListAPIView):
     search_fields = ['email', 'first_name', 'last_name', 'phone_number']
     ordering_fields = ['id', 'email', 'first_name', 'last_name', 'date_joined']
     ordering = ['id']
+    pagination_class = UserCursorPagination
     
     @swagger_auto_schema(
         operation_description="List all users. Only accessible by admin users.",
@@ -223,7 +260,9 @@ class UserProfileView(APIView):
         operation_summary="View own profile"
     )
     def get(self, request):
-        user = request.user
+        user = get_cached_user(request.user.id)
+        if user is None:
+            raise AuthenticationFailed("User not found")
         serializer = UserSerializer(user)
         return Response(serializer.data)
 
@@ -294,8 +333,16 @@ class LogoutView(APIView):
     """
     API view for user logout.
     """
+    permission_classes = [AllowAny]
+
     @swagger_auto_schema(
-        operation_description="Logout a user by removing their JWT cookie",
+        operation_description="Logout a user by removing their JWT cookie and revoking the given refresh token and the access token used for the request",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'refresh': openapi.Schema(type=openapi.TYPE_STRING),
+            }
+        ),
         responses={
             200: openapi.Response(
                 description="Success",
@@ -311,6 +358,16 @@ class LogoutView(APIView):
         operation_summary="Logout"
     )
     def post(self, request):
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                revoke_token(RevocableRefreshToken(refresh))
+            except TokenError:
+                # Already expired or revoked: nothing left to do
+                pass
+        if request.auth is not None:
+            revoke_token(request.auth)
+
         response = Response()
         response.delete_cookie('jwt')
         response.data = {
@@ -357,13 +414,13 @@ class PasswordResetRequestView(APIView):
             # Construct reset URL
             reset_url = f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}"
             
-            # Send email
-            send_mail(
+            # Delivered by the outbox worker, so SMTP latency or outages
+            # never reach this request
+            queue_email(
                 subject='Password Reset Request',
                 message=f'Click the link to reset your password: {reset_url}',
                 from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[email],
-                fail_silently=False,
             )
             
             return Response(